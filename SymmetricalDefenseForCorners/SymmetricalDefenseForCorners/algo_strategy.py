@@ -4,7 +4,6 @@ import math
 import numpy as np
 import warnings
 from sys import maxsize
-import json
 #import heapq
 
 """
@@ -17,12 +16,14 @@ Advanced strategy tips:
 
   - The GameState.map object can be manually manipulated to create hypothetical 
   board states. Though, we recommended making a copy of the map to preserve 
-  the actual current map state.
+  the actual current map state. game_state.clone() makes one cheaply.
 """
 
 class AlgoStrategy(gamelib.AlgoCore):
     def __init__(self):
         super().__init__()
+        # Receive each game state already parsed, so it is only parsed once
+        self.dispatch_parsed = True
         seed = random.randrange(maxsize)
         random.seed(seed)
         gamelib.debug_write('Random seed: {}'.format(seed))
@@ -55,7 +56,7 @@ class AlgoStrategy(gamelib.AlgoCore):
         unit deployments, and transmitting your intended deployments to the
         game engine.
         """
-        game_state = gamelib.GameState(self.config, turn_state)
+        game_state = gamelib.GameState.from_dict(self.config, turn_state)
         gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
         game_state.suppress_warnings(True)  #Comment or remove this line to enable warnings.
 
@@ -474,17 +475,12 @@ class AlgoStrategy(gamelib.AlgoCore):
         It considers that high chance that our opponent would build defensive units at the safest path on the turn, so we can 
         spawn our units at the 2nd safest location with certain probability.
         """
-        damages = []
-        target_locations = []
-        # Get the damage estimate each path will take
-        for location in location_options:
-            path = game_state.find_path_to_edge(location)
-            target_locations.append(path[-1])
-            damage = 0
-            for path_location in path:
-                # Get number of enemy turrets that can attack each location and multiply by turret damage
-                damage += len(game_state.get_attackers(path_location, 0)) * gamelib.GameUnit(TURRET, game_state.config).damage_i
-            damages.append(damage)
+        # Get all the paths in one go, locations heading to the same edge share the pathfinding work
+        paths = game_state.find_paths_to_edges(location_options)
+        paths = [paths[tuple(location)] for location in location_options]
+        target_locations = [path[-1] for path in paths]
+        # Get the damage estimate each path will take, adding up the damage of the enemy turrets that can attack each location
+        damages = game_state.estimate_path_damage(paths, 0) if paths else []
         if len(damages) < 2:
             return [3, 10]
         n = self.nth_smallest(damages, num)
@@ -498,17 +494,12 @@ class AlgoStrategy(gamelib.AlgoCore):
         It gets the path the unit will take then checks locations on that path to 
         estimate the path's damage risk.
         """
-        damages = []
-        target_locations = []
-        # Get the damage estimate each path will take
-        for location in location_options:
-            path = game_state.find_path_to_edge(location)
-            target_locations.append(path[-1])
-            damage = 0
-            for path_location in path:
-                # Get number of enemy turrets that can attack each location and multiply by turret damage
-                damage += len(game_state.get_attackers(path_location, 0)) * gamelib.GameUnit(TURRET, game_state.config).damage_i
-            damages.append(damage)
+        # Get all the paths in one go, locations heading to the same edge share the pathfinding work
+        paths = game_state.find_paths_to_edges(location_options)
+        paths = [paths[tuple(location)] for location in location_options]
+        target_locations = [path[-1] for path in paths]
+        # Get the damage estimate each path will take, adding up the damage of the enemy turrets that can attack each location
+        damages = game_state.estimate_path_damage(paths, 0) if paths else []
         if len(damages) == 0:
             return [24, 10]
         # Now just return the location that takes the least damage
@@ -523,22 +514,11 @@ class AlgoStrategy(gamelib.AlgoCore):
 
 
     def get_enemy_unit_type_coordinates(self, game_state, unit_type, valid_x = None, valid_y = None):
-        unit_type_locations = []
-        for location in game_state.game_map:
-            if game_state.contains_stationary_unit(location):
-                for unit in game_state.game_map[location]:
-                    if unit.player_index == 1 and (unit.unit_type == unit_type) and (valid_x is None or location[0] in valid_x) and (valid_y is None or location[1] in valid_y):
-                        unit_type_locations.append(location)
-        return unit_type_locations
+        return [[unit.x, unit.y] for unit in game_state.game_map.units_of(1, unit_type, valid_x, valid_y)]
     
     def detect_enemy_unit(self, game_state, unit_type=None, valid_x = None, valid_y = None):
-        total_units = 0
-        for location in game_state.game_map:
-            if game_state.contains_stationary_unit(location):
-                for unit in game_state.game_map[location]:
-                    if unit.player_index == 1 and (unit_type is None or unit.unit_type == unit_type) and (valid_x is None or location[0] in valid_x) and (valid_y is None or location[1] in valid_y):
-                        total_units += 1
-        return total_units
+        # The map keeps count of each player's units by type, row and column, so there is no need to visit every location
+        return game_state.game_map.count_units_of(1, unit_type, valid_x, valid_y)
         
     def filter_blocked_locations(self, locations, game_state):
         filtered = []
@@ -611,7 +591,7 @@ class AlgoStrategy(gamelib.AlgoCore):
         return structure_units_coordinates
 
         
-    def on_action_frame(self, turn_string):
+    def on_action_frame(self, state):
         """
         This is the action frame of the game. This function could be called 
         hundreds of times per turn and could slow the algo down so avoid putting slow code here.
@@ -619,7 +599,6 @@ class AlgoStrategy(gamelib.AlgoCore):
         Full doc on format of a game frame at: https://docs.c1games.com/json-docs.html
         """
         # Let's record at what position we get scored on
-        state = json.loads(turn_string)
         events = state["events"]
 
         # Save tracked information
@@ -0,0 +1,112 @@
+from .game_state import GameState
+from .unit import GameUnit
+from .util import decode
+
+
+class ActionFrame:
+    """A lightweight view of a single action frame
+
+    Wraps the frame as parsed from json and only builds what is asked for, so looking at a few
+    events or the raw unit lists costs nothing beyond the parse. GameUnits are only created
+    by units(), and a GameState with its GameMap only by the game_state and game_map attributes.
+    Each is built once per frame and then reused.
+
+    The frame can be read like the dict it wraps, so frame["events"]["breach"] and frame["p2Units"]
+    work exactly as on the parsed json. See json-docs.html in the root of the Starterkit for its format.
+
+    Attributes :
+        * config (JSON): A json object containing information about the game
+        * state (dict): The frame as parsed from json
+        * turn_number (int): The turn this frame belongs to
+        * frame_number (int): The number of this frame within the action phase, starting at 0
+        * game_state (:obj: GameState): A GameState built from this frame, created the first time it is used
+        * game_map (:obj: GameMap): The GameMap of game_state
+
+    """
+    def __init__(self, config, state):
+        """ Wraps a frame without building anything from it
+
+        Args:
+            * config (JSON): A json object containing information about the game
+            * state: The frame, either as the string sent by the engine or as the dict parsed from it
+
+        """
+        self.config = config
+        self.state = decode(state) if isinstance(state, str) else state
+        self.turn_number = int(self.state["turnInfo"][1])
+        self.frame_number = int(self.state["turnInfo"][2])
+        self.__units = [None, None]
+        self.__game_state = None
+
+    def __getitem__(self, key):
+        return self.state[key]
+
+    def __contains__(self, key):
+        return key in self.state
+
+    def get(self, key, default=None):
+        """Gets a top level entry of the frame, like dict.get
+        """
+        return self.state.get(key, default)
+
+    def events(self, event_type):
+        """Gets the events of a single type that happened this frame
+
+        Args:
+            event_type: The type of event, such as "breach", "damage" or "death"
+
+        Returns:
+            The list of events of that type, as sent by the engine. Empty if there were none.
+
+        """
+        return self.state["events"].get(event_type, [])
+
+    def units(self, player_index):
+        """Gets the units of a player as GameUnits, built the first time they are asked for
+
+        Args:
+            player_index: The player whose units to get, 0 for you and 1 for your opponent
+
+        Returns:
+            A list of GameUnits. Structures marked for removal or upgraded have pending_removal or upgraded set,
+            as in GameState. The units are not placed on a GameMap, use game_map for that.
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            return []
+        if self.__units[player_index] is None:
+            self.__units[player_index] = self.__create_units(self.state["p1Units" if player_index == 0 else "p2Units"], player_index)
+        return self.__units[player_index]
+
+    def __create_units(self, units, player_index):
+        typedef = self.config["unitInformation"]
+        remove = typedef[6]["shorthand"]
+        upgrade = typedef[7]["shorthand"]
+        created = []
+        structures = {}
+        for i, unit_types in enumerate(units):
+            unit_type = typedef[i].get("shorthand")
+            for uinfo in unit_types:
+                x, y = int(uinfo[0]), int(uinfo[1])
+                if unit_type == remove:
+                    if (x, y) in structures:
+                        structures[x, y].pending_removal = True
+                elif unit_type == upgrade:
+                    if (x, y) in structures:
+                        structures[x, y].upgrade()
+                else:
+                    unit = GameUnit(unit_type, self.config, player_index, float(uinfo[2]), x, y)
+                    if unit.stationary:
+                        structures[x, y] = unit
+                    created.append(unit)
+        return created
+
+    @property
+    def game_state(self):
+        if self.__game_state is None:
+            self.__game_state = GameState.from_dict(self.config, self.state)
+        return self.__game_state
+
+    @property
+    def game_map(self):
+        return self.game_state.game_map
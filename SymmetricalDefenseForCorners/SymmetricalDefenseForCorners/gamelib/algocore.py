@@ -1,7 +1,50 @@
-import json
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
 
 from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+from .time_budget import TimeBudget
+from .util import get_command, debug_write, decode, BANNER_TEXT, send_command
+
+_idle_planner = None
+
+def _start_idle_planner(algo_class, config):
+    """
+    Sets up the strategy instance a planning worker process calls on_idle_plan on.
+    """
+    global _idle_planner
+    _idle_planner = algo_class()
+    _idle_planner.on_game_start(config)
+
+def _predict_board(state):
+    """
+    Copies a parsed action frame as the board expected when the action phase ends: mobile units are dropped and 
+    structures marked for removal are taken off. Resources and the turn number are left as they are in the frame.
+    """
+    predicted = dict(state)
+    predicted["turnInfo"] = [0, state["turnInfo"][1], -1]
+    for units_key in ["p1Units", "p2Units"]:
+        units = state[units_key]
+        removed = set((unit[0], unit[1]) for unit in units[6]) if len(units) > 6 else set()
+        kept = [[unit for unit in unit_list if (unit[0], unit[1]) not in removed] for unit_list in units[:3]]
+        kept += [[] for _ in units[3:7]]
+        kept += [[unit for unit in unit_list if (unit[0], unit[1]) not in removed] for unit_list in units[7:]]
+        predicted[units_key] = kept
+    return predicted
+
+def _run_idle_plan(state):
+    """
+    Runs on_idle_plan in a planning worker process on a board from _predict_board, after projecting both players' 
+    resources to the next turn. Returns the structure_hash of the predicted board with the plan.
+    """
+    predicted_state = GameState.from_dict(_idle_planner.config, state)
+    for player_index, resources in enumerate(predicted_state._player_resources):
+        resources['MP'] = predicted_state.project_future_MP(1, player_index)
+        resources['SP'] += _idle_planner.config["resources"]["coresPerRound"]
+    predicted_state.turn_number += 1
+    return predicted_state.game_map.structure_hash, _idle_planner.on_idle_plan(predicted_state)
 
 class AlgoCore(object):
     """
@@ -10,10 +53,51 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * dispatch_parsed (bool): If True, on_turn and on_action_frame are passed the game state as the dict 
+          already parsed from the engine's message, ready for GameState.from_dict, instead of the raw string. 
+          Each message is then only parsed once. False by default.
+        * frame_events (list): Event types such as "breach", "death" or "damage". If set, action frames without any of 
+          these events are skipped without being parsed, except for the last frame of each action phase, which is 
+          delivered when the next turn or the end of the game arrives. None by default, which delivers every frame.
+        * threaded_reader (bool): If True, a background thread reads stdin into a queue, so the engine pipe is drained
+          while on_turn, on_action_frame or on_idle run. False by default.
+        * frame_queue_size (int): The most action frames the reader thread queues. When it is full the oldest queued 
+          frame is dropped. Turn and end of game messages are never dropped.
+        * dropped_frames (int): The number of action frames dropped by the reader thread so far
+        * speculative_planning (bool): If True, on_idle_plan is run in a worker process during each action phase,
+          and its plan is available from get_speculative_plan in the next on_turn. False by default.
+        * idle_plan_wait (float): The most seconds to wait at the start of a turn for a plan that is still running on 
+          the same structures as the turn. 0 by default, so plans that are not ready are dropped.
+        * time_budget (:obj: TimeBudget): The time budget of the current turn, started when the turn message is received
+        * turn_time_limit (float): The milliseconds each turn's time_budget allows. If None, the engine's soft limit 
+          from the config is used, waitTimeBotSoft in timingAndReplay.
+        * turn_time_margin (float): The milliseconds each turn's time_budget keeps in hand to submit the turn. 500 by default.
+        * turn_fallback (bool): If True, the best turn given to time_budget.set_best is submitted when the budget runs out. 
+          Turns must then be submitted with time_budget.submit. False by default.
 
     """
     def __init__(self):
         self.config = None
+        self.dispatch_parsed = False
+        self.frame_events = None
+        self.threaded_reader = False
+        self.frame_queue_size = 64
+        self.dropped_frames = 0
+        self.__messages = deque()
+        self.__queued_frames = 0
+        self.__messages_ready = threading.Condition()
+        self.speculative_planning = False
+        self.idle_plan_wait = 0
+        self.__planner = None
+        self.__plan_future = None
+        self.__plan_key = None
+        self.__next_plan_state = None
+        self.__plan_lock = threading.RLock()
+        self.__speculative_plan = None
+        self.time_budget = None
+        self.turn_time_limit = None
+        self.turn_time_margin = 500
+        self.turn_fallback = False
 
     def on_game_start(self, config):
         """
@@ -27,6 +111,7 @@ class AlgoCore(object):
         """
         This step function is called at the start of each turn.
         It is passed the current game state, which can be used to initiate a new GameState object. 
+        The game state is a string, or a dict if dispatch_parsed is set. 
         By default, it sends empty commands to the game engine. \n
         algo_strategy.py inherits from AlgoCore and overrides this on turn function. 
         Adjusting the on_turn function in algo_strategy is the main way to adjust your algo's logic. 
@@ -40,9 +125,53 @@ class AlgoCore(object):
         The action phase is made up of a sequence of distinct frames. 
         Each of these frames is sent to the algo in order. 
         They can be handled in this function. 
+        The frame is a string, or a dict if dispatch_parsed is set. 
         """
         pass
 
+    def on_idle(self):
+        """
+        Called when threaded_reader is set and no message from the engine is waiting, 
+        for example while the engine plays out the action phase. 
+        Use it to do work ahead of the next turn, such as planning, in small steps. 
+        Return True to be called again as soon as possible, or False to wait for the next message. 
+        By default, it does nothing.
+        """
+        return False
+
+    def on_idle_plan(self, predicted_state):
+        """
+        Called when speculative_planning is set, during the action phase, to plan the next turn ahead of time. 
+        It runs in a worker process, on a separate instance of your strategy that has been through 
+        __init__ and on_game_start but not any turns, so it cannot see attributes set later or change this instance. \n
+        predicted_state is a GameState of the next turn predicted from an action frame: it has the structures of the frame 
+        except those marked for removal, no mobile units, and the MP and SP each player will have after the turn's income. 
+        Damage done later in the action phase is not predicted. While a plan runs, newer frames are kept, and once it 
+        finishes the latest of them is planned if its structures changed. A plan still running when the next turn 
+        starts, without waiting for it, or when the game ends, is stopped by terminating the worker process. 
+        Return a plan of your choosing, anything that can be pickled. In on_turn, get it with get_speculative_plan. 
+        By default, it plans nothing.
+        """
+        return None
+
+    def get_speculative_plan(self, game_state, exact=True):
+        """
+        Gets the plan on_idle_plan made during the last action phase.
+
+        Args:
+            * game_state: The GameState of the current turn
+            * exact: If True, only return the plan if it was made for the same structures as game_state. 
+              If False, return the latest plan either way, for example to patch it.
+
+        Returns:
+            The plan, or None if there is none
+        """
+        if self.__speculative_plan is None:
+            return None
+        structure_hash, plan = self.__speculative_plan
+        if exact and not structure_hash == game_state.game_map.structure_hash:
+            return None
+        return plan
 
     def start(self):
         """ 
@@ -53,43 +182,261 @@ class AlgoCore(object):
         """
         debug_write(BANNER_TEXT)
 
+        if self.threaded_reader:
+            threading.Thread(target=self.__read_messages, daemon=True).start()
+
+        pending_frame = None
         while True:
             # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
             # manually kill this Python program.
-            game_state_string = get_command()
+            if self.threaded_reader:
+                received, game_state_string = self.__next_message()
+            else:
+                game_state_string = get_command()
+                received = time.perf_counter()
             if "replaySave" in game_state_string:
                 """
                 This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
                 """
-                parsed_config = json.loads(game_state_string)
+                parsed_config = decode(game_state_string)
                 self.on_game_start(parsed_config)
             elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
-                stateType = int(state.get("turnInfo")[0])
-                if stateType == 0:
-                    """
-                    This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
-                    deploy phase. Printing is handled by the provided functions.
-                    """
-                    self.on_turn(game_state_string)
-                elif stateType == 1:
-                    """
-                    If stateType == 1, this game_state_string string represents a single frame of an action phase
-                    """
-                    self.on_action_frame(game_state_string)
-                elif stateType == 2:
-                    """
-                    This is the end game message. This means the game is over so break and finish the program.
-                    """
-                    debug_write("Got end state, game over. Stopping algo.")
+                if self.frame_events is not None:
+                    if self.__message_type(game_state_string) == 1:
+                        if not self.__has_frame_events(game_state_string):
+                            # Keep the frame in case it is the last of the action phase
+                            pending_frame = game_state_string
+                            continue
+                        pending_frame = None
+                    elif pending_frame is not None:
+                        self.__handle_state(pending_frame, received)
+                        pending_frame = None
+                if not self.__handle_state(game_state_string, received):
                     break
-                else:
-                    """
-                    Something is wrong? Received an incorrect or improperly formatted string.
-                    """
-                    debug_write("Got unexpected string with turnInfo: {}".format(game_state_string))
             else:
                 """
                 Something is wrong? Received an incorrect or improperly formatted string.
                 """
                 debug_write("Got unexpected string : {}".format(game_state_string))
+
+    def __handle_state(self, game_state_string, received):
+        """
+        Parses a turn, action frame or end of game message and passes it on.
+        received is the time.perf_counter() value the message arrived at. Returns False once the game is over.
+        """
+        state = decode(game_state_string)
+        stateType = int(state.get("turnInfo")[0])
+        message = state if self.dispatch_parsed else game_state_string
+        if stateType == 0:
+            """
+            This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
+            deploy phase. Printing is handled by the provided functions.
+            """
+            self.__start_time_budget(received)
+            if self.speculative_planning:
+                self.__collect_plan(state)
+            self.on_turn(message)
+            self.time_budget.cancel()
+        elif stateType == 1:
+            """
+            If stateType == 1, this game_state_string string represents a single frame of an action phase
+            """
+            self.on_action_frame(message)
+            if self.speculative_planning:
+                self.__plan_ahead(state)
+        elif stateType == 2:
+            """
+            This is the end game message. This means the game is over so break and finish the program.
+            """
+            debug_write("Got end state, game over. Stopping algo.")
+            with self.__plan_lock:
+                self.__next_plan_state = None
+                self.__stop_planner()
+            return False
+        else:
+            """
+            Something is wrong? Received an incorrect or improperly formatted string.
+            """
+            debug_write("Got unexpected string with turnInfo: {}".format(game_state_string))
+        return True
+
+    def __message_type(self, game_state_string):
+        """
+        Reads the message type, the first entry of turnInfo, without parsing the whole message.
+        """
+        index = game_state_string.find('"turnInfo":[')
+        if index == -1 or not game_state_string[index + 12].isdigit():
+            return int(decode(game_state_string)["turnInfo"][0])
+        return int(game_state_string[index + 12])
+
+    def __has_frame_events(self, game_state_string):
+        """
+        Checks whether an action frame has any of the events in frame_events without parsing it.
+        The engine sends compact json, so a non empty list of events starts with '[['.
+        """
+        if '"events":{' not in game_state_string:
+            return True
+        for event_type in self.frame_events:
+            if '"{}":[['.format(event_type) in game_state_string:
+                return True
+        return False
+
+    def __read_messages(self):
+        """
+        Runs on the reader thread, moving lines from stdin into the message queue, with the time each was read at, 
+        until the game process closes it.
+        Lines that cannot be read are logged and queued as they are, so the main loop fails on them as it would without the thread.
+        """
+        while True:
+            try:
+                line = sys.stdin.readline()
+            except (EOFError, ValueError):
+                line = ""
+            except Exception as error:
+                debug_write("Could not read a message from the engine, stopping the reader: {}".format(error))
+                line = ""
+            received = time.perf_counter()
+            with self.__messages_ready:
+                if line == "":
+                    self.__messages.append((False, received, None))
+                    self.__messages_ready.notify()
+                    return
+                try:
+                    is_frame = "turnInfo" in line and self.__message_type(line) == 1
+                except Exception as error:
+                    debug_write("Could not read the type of message {}: {}".format(line.strip(), error))
+                    is_frame = False
+                if is_frame:
+                    if self.__queued_frames >= self.frame_queue_size:
+                        self.dropped_frames += 1
+                        if self.__queued_frames == 0:
+                            continue
+                        for index, (queued_is_frame, _, _) in enumerate(self.__messages):
+                            if queued_is_frame:
+                                del self.__messages[index]
+                                break
+                    else:
+                        self.__queued_frames += 1
+                self.__messages.append((is_frame, received, line))
+                self.__messages_ready.notify()
+
+    def __next_message(self):
+        """
+        Takes the next message off the reader thread's queue, calling on_idle while there is none. 
+        Returns the time.perf_counter() value the message was read at, and the message.
+        """
+        idle = True
+        while True:
+            with self.__messages_ready:
+                if not self.__messages and not idle:
+                    self.__messages_ready.wait()
+                if self.__messages:
+                    is_frame, received, message = self.__messages.popleft()
+                    if is_frame:
+                        self.__queued_frames -= 1
+                    break
+            idle = self.on_idle()
+        if message is None:
+            debug_write("Got EOF, parent game process must have died, exiting for cleanup")
+            exit()
+        return received, message
+
+    def __board_key(self, state):
+        """
+        The locations of every structure, removal and upgrade in a parsed game state, to tell boards apart cheaply.
+        """
+        key = []
+        for player_units in [state["p1Units"], state["p2Units"]]:
+            for units in player_units[:3] + player_units[6:]:
+                key.append(tuple((unit[0], unit[1]) for unit in units))
+        return tuple(key)
+
+    def __plan_ahead(self, state):
+        """
+        Starts on_idle_plan on the board predicted from an action frame. If a plan is running, the frame is kept 
+        instead, replacing any older one, and planned when the running plan finishes.
+        """
+        with self.__plan_lock:
+            self.__next_plan_state = state
+            if self.__plan_future is None or self.__plan_future.done():
+                self.__submit_plan()
+
+    def __submit_plan(self):
+        """
+        Starts on_idle_plan on the kept frame, unless its predicted board was planned already. Called holding __plan_lock.
+        """
+        state = self.__next_plan_state
+        if state is None:
+            return
+        self.__next_plan_state = None
+        predicted = _predict_board(state)
+        key = self.__board_key(predicted)
+        if self.__plan_future is not None and key == self.__plan_key:
+            return
+        try:
+            if self.__planner is None:
+                self.__planner = ProcessPoolExecutor(max_workers=1, initializer=_start_idle_planner, initargs=(type(self), self.config))
+            self.__plan_future = self.__planner.submit(_run_idle_plan, predicted)
+            self.__plan_key = key
+            self.__plan_future.add_done_callback(self.__plan_done)
+        except Exception as error:
+            debug_write("Could not start speculative planning, turning it off: {}".format(error))
+            self.speculative_planning = False
+
+    def __plan_done(self, future):
+        """
+        Called when a plan finishes, on the worker pool's thread, to plan the latest frame kept meanwhile.
+        """
+        with self.__plan_lock:
+            if future is self.__plan_future:
+                self.__submit_plan()
+
+    def __collect_plan(self, state):
+        """
+        Keeps the result of the last on_idle_plan for get_speculative_plan, waiting up to idle_plan_wait for a plan on the right board.
+        """
+        with self.__plan_lock:
+            future = self.__plan_future
+            self.__plan_future = None
+            self.__next_plan_state = None
+        self.__speculative_plan = None
+        if future is None:
+            return
+        if not future.done() and self.idle_plan_wait > 0 and self.__plan_key == self.__board_key(state):
+            wait([future], timeout=self.idle_plan_wait)
+        if not future.done():
+            # A running plan cannot be cancelled, and would hold up the plans of the next action phase
+            with self.__plan_lock:
+                self.__stop_planner()
+        elif future.exception() is not None:
+            debug_write("Speculative planning failed: {}".format(future.exception()))
+        else:
+            self.__speculative_plan = future.result()
+
+    def __stop_planner(self):
+        """
+        Terminates the planning worker process, dropping any plan it is running. The next plan starts a new one. 
+        Called holding __plan_lock.
+        """
+        if self.__planner is None:
+            return
+        planner = self.__planner
+        self.__planner = None
+        self.__plan_future = None
+        processes = list((planner._processes or {}).values())
+        for process in processes:
+            process.terminate()
+        planner.shutdown(wait=False)
+        for process in processes:
+            process.join()
+
+    def __start_time_budget(self, received):
+        """
+        Starts time_budget for a turn that arrived at received.
+        """
+        limit = self.turn_time_limit
+        if limit is None:
+            limit = (self.config or {}).get("timingAndReplay", {}).get("waitTimeBotSoft", 5000)
+        self.time_budget = TimeBudget(limit, self.turn_time_margin, received)
+        if self.turn_fallback:
+            self.time_budget.start_fallback()
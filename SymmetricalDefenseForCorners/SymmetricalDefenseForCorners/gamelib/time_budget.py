@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+
+from .util import debug_write, send_command
+
+
+class TimeBudget:
+    """Keeps track of the time left to submit a turn
+
+    AlgoCore starts one as soon as a turn message is received and keeps it in its time_budget attribute.
+    Check should_stop() inside long searches to finish in time, and keep the best turn found so far with set_best().
+
+    If the fallback is started, the best turn is submitted for you when the time runs out. Submit through
+    submit() instead of GameState.submit_turn(), so a turn is never sent to the engine twice.
+
+    Attributes :
+        * limit_ms (float): The time allowed for the turn, in milliseconds
+        * margin_ms (float): The milliseconds kept in hand at the end of the budget to submit the turn
+        * submitted (bool): Whether the turn was submitted, by submit() or by the fallback
+
+    """
+    def __init__(self, limit_ms, margin_ms=0, start=None):
+        """ Starts the budget
+
+        Args:
+            * limit_ms: The time allowed for the turn, in milliseconds
+            * margin_ms: The milliseconds to keep in hand to submit the turn
+            * start: The time.perf_counter() value the turn started at, now if None
+
+        """
+        self.limit_ms = limit_ms
+        self.margin_ms = margin_ms
+        self.submitted = False
+        self.__start = time.perf_counter() if start is None else start
+        self.__best = None
+        self.__lock = threading.Lock()
+        self.__timer = None
+
+    def elapsed_ms(self):
+        """The milliseconds since the turn started
+        """
+        return (time.perf_counter() - self.__start) * 1000
+
+    def remaining_ms(self):
+        """The milliseconds left before the margin is reached and the fallback, if started, submits the best turn
+        """
+        return self.limit_ms - self.margin_ms - self.elapsed_ms()
+
+    def should_stop(self, reserve_ms=0):
+        """Checks if a search should stop now to submit in time
+
+        Args:
+            reserve_ms: Extra milliseconds the caller needs to finish up after stopping
+
+        Returns:
+            True once remaining_ms() is at most reserve_ms, or the turn was already submitted
+
+        """
+        return self.submitted or self.remaining_ms() <= reserve_ms
+
+    def set_best(self, game_state):
+        """Keeps the structures and units queued on a GameState as the best turn found so far.
+        They are copied, so the GameState can keep changing afterwards.
+
+        Args:
+            game_state: The GameState holding the turn
+
+        """
+        with self.__lock:
+            self.__best = (list(game_state._build_stack), list(game_state._deploy_stack))
+
+    def submit(self, game_state):
+        """Submits the turn queued on a GameState, unless the turn was already submitted
+
+        Args:
+            game_state: The GameState holding the turn
+
+        Returns:
+            True if the turn was submitted, False if it had already been
+
+        """
+        with self.__lock:
+            if self.submitted:
+                debug_write("The time budget ran out and the best turn was already submitted")
+                return False
+            game_state.submit_turn()
+            self.submitted = True
+        self.cancel()
+        return True
+
+    def start_fallback(self):
+        """Submits the best turn found so far, or an empty turn, once remaining_ms() runs out
+        and the turn has not been submitted yet
+        """
+        self.__timer = threading.Timer(max(self.remaining_ms(), 0) / 1000, self.__expire)
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def cancel(self):
+        """Stops the fallback
+        """
+        if self.__timer is not None:
+            self.__timer.cancel()
+
+    def __expire(self):
+        with self.__lock:
+            if self.submitted:
+                return
+            build_stack, deploy_stack = self.__best if self.__best is not None else ([], [])
+            debug_write("Turn time budget ran out after {:.0f} ms, submitting the best turn so far".format(self.elapsed_ms()))
+            send_command(json.dumps(build_stack))
+            send_command(json.dumps(deploy_stack))
+            self.submitted = True
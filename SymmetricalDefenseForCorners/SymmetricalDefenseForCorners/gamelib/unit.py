@@ -1,3 +1,6 @@
+from collections import OrderedDict
+
+
 def is_stationary(unit_type, structure_types):
     """
         Args:
@@ -9,6 +12,87 @@ def is_stationary(unit_type, structure_types):
     return unit_type in structure_types
 
 
+class UnitStats:
+    """The stats shared by every unit of one type and upgrade state. Records are immutable and built once per config.
+
+    Attributes :
+        * stationary (bool): Whether or not units of this type are structures
+        * speed (float): A unit will move once every 1/speed frames
+        * damage_f (int): The amount of damage a mobile unit will deal to enemy structures.
+        * damage_i (int): The amount of damage a mobile unit will deal to enemy mobile units.
+        * attackRange (float): The effective range for attacking
+        * shieldRange (float): The effective range for shielding
+        * max_health (float): The starting health
+        * shieldPerUnit (float): how much shield is given per unit
+        * cost ((int, int)): The resource costs, first is SP second is MP
+
+    """
+    __slots__ = ("stationary", "speed", "damage_f", "damage_i", "attackRange", "shieldRange", "max_health", "shieldPerUnit", "cost")
+
+    def __init__(self, type_config, base=None):
+        """Reads the stats of a unit type, or its upgrade if base holds the stats of the unupgraded type
+
+        """
+        if base is None:
+            values = (type_config["unitCategory"] == 0, type_config.get("speed", 0), type_config.get("attackDamageTower", 0), 
+                      type_config.get("attackDamageWalker", 0), type_config.get("attackRange", 0), type_config.get("shieldRange", 0), 
+                      type_config.get("startHealth", 0), type_config.get("shieldPerUnit", 0), (type_config.get("cost1", 0), type_config.get("cost2", 0)))
+        else:
+            type_config = type_config.get("upgrade", {})
+            values = (base.stationary, type_config.get("speed", base.speed), type_config.get("attackDamageTower", base.damage_f), 
+                      type_config.get("attackDamageWalker", base.damage_i), type_config.get("attackRange", base.attackRange), 
+                      type_config.get("shieldRange", base.shieldRange), type_config.get("startHealth", base.max_health), 
+                      type_config.get("shieldPerUnit", base.shieldPerUnit), 
+                      (type_config.get("cost1", 0) + base.cost[0], type_config.get("cost2", 0) + base.cost[1]))
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UnitStats records are shared between units and cannot be changed")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (_unit_stats_from_values, (tuple(getattr(self, name) for name in self.__slots__),))
+
+def _unit_stats_from_values(values):
+    """Rebuilds a pickled UnitStats record
+    """
+    stats = UnitStats.__new__(UnitStats)
+    for name, value in zip(UnitStats.__slots__, values):
+        object.__setattr__(stats, name, value)
+    return stats
+
+_stats_tables = OrderedDict()
+# Each entry keeps its config alive, so only the configs used most recently are kept
+_STATS_TABLE_LIMIT = 8
+
+def _get_unit_stats(config, unit_type):
+    """Gets the (unupgraded, upgraded) UnitStats of a unit type, building them the first time a config asks for them
+    """
+    entry = _stats_tables.get(id(config))
+    if entry is None or entry[0] is not config:
+        type_configs = {}
+        for type_config in config["unitInformation"]:
+            type_configs[type_config.get("shorthand")] = type_config
+        entry = (config, type_configs, {})
+        _stats_tables[id(config)] = entry
+        if len(_stats_tables) > _STATS_TABLE_LIMIT:
+            _stats_tables.popitem(last=False)
+    _stats_tables.move_to_end(id(config))
+    stats = entry[2].get(unit_type)
+    if stats is None:
+        type_config = entry[1][unit_type]
+        base = UnitStats(type_config)
+        stats = (base, UnitStats(type_config, base))
+        entry[2][unit_type] = stats
+    return stats
+
+
 class GameUnit:
     """Holds information about a Unit. 
 
@@ -31,7 +115,12 @@ class GameUnit:
         * pending_removal (boolean): If this unit is marked for removal by its owner
         * upgraded (boolean): If this unit is upgraded
 
+    The stats of a unit, from stationary to shieldPerUnit, are read from a UnitStats record shared by every 
+    unit of the same type and upgrade state, so they cannot be assigned to.
+
     """
+    __slots__ = ("unit_type", "config", "player_index", "pending_removal", "upgraded", "x", "y", "_health", "_stats", "_game_map")
+
     def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
         """ Initialize unit variables using args passed
 
@@ -43,36 +132,87 @@ class GameUnit:
         self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
-        self.health = self.max_health if not health else health
-
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, FACTORY
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+        self._game_map = None
+        self._stats = _get_unit_stats(config, unit_type)[0]
+        self.health = self._stats.max_health if not health else health
+
+    @property
+    def stationary(self):
+        return self._stats.stationary
+
+    @property
+    def speed(self):
+        return self._stats.speed
+
+    @property
+    def damage_f(self):
+        return self._stats.damage_f
+
+    @property
+    def damage_i(self):
+        return self._stats.damage_i
+
+    @property
+    def attackRange(self):
+        return self._stats.attackRange
+
+    @property
+    def shieldRange(self):
+        return self._stats.shieldRange
 
+    @property
+    def max_health(self):
+        return self._stats.max_health
+
+    @property
+    def shieldPerUnit(self):
+        return self._stats.shieldPerUnit
+
+    @property
+    def cost(self):
+        return list(self._stats.cost)
+
+    @property
+    def health(self):
+        return self._health
+
+    @health.setter
+    def health(self, health):
+        self._health = health
+        if self._game_map is not None:
+            self._game_map._update_health(self)
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
+        """Applies this unit's upgrade stats. The GameMap holding the unit is told, so its structure_hash stays current.
+        """
+        self._stats = _get_unit_stats(self.config, self.unit_type)[1]
         self.upgraded = True
+        if self._game_map is not None:
+            self._game_map._update_location(self.x, self.y)
 
+    def _undo_upgrade(self):
+        """Restores this unit's unupgraded stats, used by GameState.rollback
+        """
+        self._stats = _get_unit_stats(self.config, self.unit_type)[0]
+        self.upgraded = False
+        if self._game_map is not None:
+            self._game_map._update_location(self.x, self.y)
+
+    def _copy(self, game_map):
+        """Copies this unit, sharing its config and stats, for game_map to hold
+        """
+        unit = GameUnit.__new__(GameUnit)
+        unit.unit_type = self.unit_type
+        unit.config = self.config
+        unit.player_index = self.player_index
+        unit.pending_removal = self.pending_removal
+        unit.upgraded = self.upgraded
+        unit.x = self.x
+        unit.y = self.y
+        unit._health = self._health
+        unit._stats = self._stats
+        unit._game_map = game_map
+        return unit
 
     def __toString(self):
         owner = "Friendly" if self.player_index == 0 else "Enemy"
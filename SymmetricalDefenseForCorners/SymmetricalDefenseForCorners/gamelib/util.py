@@ -1,5 +1,20 @@
 import sys
 
+# The fastest installed json decoder is used to parse engine messages, falling back to the standard library
+try:
+    import orjson as _json_decoder
+    JSON_DECODER = "orjson"
+except ImportError:
+    try:
+        import ujson as _json_decoder
+        JSON_DECODER = "ujson"
+    except ImportError:
+        try:
+            import simdjson as _json_decoder
+            JSON_DECODER = "simdjson"
+        except ImportError:
+            import json as _json_decoder
+            JSON_DECODER = "json"
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
 
@@ -21,6 +36,21 @@ def get_command():
         exit()
     return ret
 
+def decode(message):
+    """Parses a json message from the game engine
+
+    Uses orjson, ujson or simdjson if one is installed, and the standard json module otherwise.
+    JSON_DECODER names the decoder in use.
+
+    Args:
+        message: The message, a json string
+
+    Returns:
+        The parsed message, as dicts, lists and numbers like json.loads returns
+
+    """
+    return _json_decoder.loads(message)
+
 def send_command(cmd):
     """Sends your turn to standard output.
     Should usually only be called by 'GameState.submit_turn()'
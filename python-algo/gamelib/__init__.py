@@ -13,6 +13,12 @@ Investigating it is useful for any player that wants to access information about
 The AlgoCore class in algocore.py handles communication with the game engine, and forms the bones of an algo. AlgoStrategy inherits from it. 
 Investigating it is useful for advanced players interested in getting data from the action phase or communicating directly with the game engine. \n
 
+The ActionFrame class in action_frame.py is a lightweight view of a single action frame. 
+It only builds units or a game map when they are asked for, which keeps on_action_frame fast. \n
+
+The TimeBudget class in time_budget.py tracks the time left to submit a turn. 
+AlgoCore starts one for every turn, and it can submit the best turn found so far if time runs out. \n
+
 The Navigation class in navigation.py contains functions related to pathfinding, which are used by GameState in pathing related functions. 
 Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
 
@@ -24,6 +30,9 @@ from .util import debug_write
 from .game_state import GameState
 from .unit import GameUnit
 from .game_map import GameMap
+from .navigation import PathCache
+from .action_frame import ActionFrame
+from .time_budget import TimeBudget
 
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+__all__ = ["action_frame", "algocore", "game_state", "game_map", "navigation", "time_budget", "unit", "util"]
  
\ No newline at end of file
@@ -1,7 +1,52 @@
 import math
+import random
 from .unit import GameUnit
 from .util import debug_write
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_zobrist_tables = {}
+
+def _get_zobrist_keys(key_count):
+    """Gets key_count random 64 bit keys for Zobrist hashing
+
+    The keys are drawn from a fixed seed, so hashes are stable across games. Tables are built once per size.
+    """
+    if key_count not in _zobrist_tables:
+        rng = random.Random(key_count)
+        _zobrist_tables[key_count] = [rng.getrandbits(64) for _ in range(key_count)]
+    return _zobrist_tables[key_count]
+
+_range_tables = {}
+# Radii from the config are registered first, so only radii passed in by strategies can go over the limit
+_RANGE_TABLE_LIMIT = 64
+
+def _get_range_table(radius, hit_radius, arena_size):
+    """Gets the (offsets, cells) range table of a radius
+
+    offsets holds every (dx, dy) within radius + hit_radius of a location, ordered by dx and then dy.
+    cells holds, per location x * arena_size + y, the tuple of in bounds locations in range, filled in the first time it is asked for.
+    Tables are built once per radius and shared by every GameMap, for the first _RANGE_TABLE_LIMIT radii asked for.
+    Tables of later radii are built for the call and not kept.
+    """
+    key = (radius, hit_radius, arena_size)
+    table = _range_tables.get(key)
+    if table is None:
+        search_radius = math.ceil(radius)
+        offsets = []
+        for i in range(-search_radius, search_radius + 1):
+            for j in range(-search_radius, search_radius + 1):
+                # A unit with a given range affects all locations who's centers are within that range + get hit radius
+                if math.sqrt(i**2 + j**2) < radius + hit_radius:
+                    offsets.append((i, j))
+        table = (tuple(offsets), [None] * (arena_size * arena_size))
+        if len(_range_tables) < _RANGE_TABLE_LIMIT:
+            _range_tables[key] = table
+    return table
+
 class GameMap:
     """Holds data about the current game map and provides functions
     useful for getting information related to the map.
@@ -18,6 +63,27 @@ class GameMap:
         * TOP_LEFT (int): A constant that represents the top left edge
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
+        * blocked_grid (bytearray): Flat grid indexed by x * ARENA_SIZE + y, nonzero where a structure stands. Kept up to date by add_unit, remove_unit and assignment, and read directly by the pathfinder.
+        * structure_hash (int): A 64 bit Zobrist hash of the location, type, owner and upgrade state of every structure.
+          Updated in constant time by add_unit, remove_unit, assignment and GameUnit.upgrade.
+        * structure_types (numpy.ndarray): Read only 28x28 int8 array indexed [x, y], holding the index of the structure's type
+          in config["unitInformation"], or -1 where there is no structure
+        * structure_owners (numpy.ndarray): Read only int8 array, the player_index of each structure, or -1
+        * structure_health (numpy.ndarray): Read only float array, the health of each structure, or 0
+        * structure_upgraded (numpy.ndarray): Read only bool array, True where a structure is upgraded
+
+    The structure arrays need NumPy. They are built the first time one is used, and from then on kept up to date
+    like blocked_grid, so whole board analysis can use array operations instead of looping over game_map[x, y].
+    Mobile units are only held in the unit lists.
+
+    Changes made by appending to or editing the list returned by game_map[x, y] are not tracked.
+    Assign the new list with game_map[x, y] = units to bring blocked_grid and the hashes up to date.
+
+    units_of() and count_units_of() find the units of a player, by type and area, from indexes kept up to date 
+    like blocked_grid, without visiting every location.
+
+    clone() makes an independent copy of the map cheaply. It copies every unit up front, so units held from
+    either map, including ones taken before the clone was made, only ever change the map they came from.
 
     """
     def __init__(self, config):
@@ -37,6 +103,25 @@ class GameMap:
         self.BOTTOM_RIGHT = 3
         self.__map = self.__empty_grid()
         self.__start = [13,0]
+        self.blocked_grid = bytearray(self.ARENA_SIZE * self.ARENA_SIZE)
+        self.structure_hash = 0
+        self.__blocked_hash = 0
+        self.__location_hashes = [0] * (self.ARENA_SIZE * self.ARENA_SIZE)
+        self.__type_indices = {}
+        for index, unit_info in enumerate(config["unitInformation"]):
+            self.__type_indices[unit_info.get("shorthand")] = index
+        self.__blocked_keys = _get_zobrist_keys(self.ARENA_SIZE * self.ARENA_SIZE)
+        self.__structure_keys = _get_zobrist_keys(self.ARENA_SIZE * self.ARENA_SIZE * len(self.__type_indices) * 4)
+        self.__threat = None
+        self.__structure_arrays = None
+        self.__unit_index = None
+        self.__indexed = None
+        self.__hit_radius = config["unitInformation"][0].get('getHitRadius', 0)
+        for unit_info in config["unitInformation"]:
+            for stats in (unit_info, unit_info.get("upgrade", {})):
+                for radius in (stats.get("attackRange"), stats.get("shieldRange")):
+                    if radius is not None:
+                        _get_range_table(radius, self.__hit_radius, self.ARENA_SIZE)
     
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
@@ -47,6 +132,9 @@ class GameMap:
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
             self.__map[location[0]][location[1]] = val
+            for unit in val:
+                unit._game_map = self
+            self._update_location(location[0], location[1])
             return
         self._invalid_coordinates(location)
 
@@ -75,6 +163,223 @@ class GameMap:
                 grid[x].append([])
         return grid
 
+    def clone(self):
+        """Makes a copy of this map that can be changed without affecting it
+
+        The config and unit stats are shared, and each unit is copied with only a reference to its stats,
+        so cloning costs little more than copying the grid of lists.
+
+        Returns:
+            A new GameMap with the same units, blocked_grid and hashes
+
+        """
+        clone = GameMap.__new__(GameMap)
+        clone.__dict__.update(self.__dict__)
+        clone.__map = [[[unit._copy(clone) for unit in units] if units else [] for units in column] for column in self.__map]
+        clone.__start = [13,0]
+        clone.blocked_grid = bytearray(self.blocked_grid)
+        clone.__location_hashes = list(self.__location_hashes)
+        if self.__unit_index is not None:
+            clone.__unit_index = dict((key, ([dict(row) for row in rows], list(row_counts), list(column_counts))) 
+                                      for key, (rows, row_counts, column_counts) in self.__unit_index.items())
+            clone.__indexed = list(self.__indexed)
+        if self.__structure_arrays is not None:
+            clone.__structure_arrays = [array.copy() for array in self.__structure_arrays]
+        if self.__threat is not None:
+            clone.__threat = [[list(grid) for grid in grids] for grids in self.__threat[:4]] + [list(self.__threat[4])]
+        return clone
+
+    def _update_location(self, x, y):
+        """Brings blocked_grid and the hashes up to date with the structures at a location.
+        Called whenever the units at a location change, and by GameUnit.upgrade.
+        """
+        index = x * self.ARENA_SIZE + y
+        location_hash = 0
+        for unit in self.__map[x][y]:
+            if unit.stationary:
+                player = 1 if unit.player_index == 1 else 0
+                key = ((index * len(self.__type_indices) + self.__type_indices[unit.unit_type]) * 2 + player) * 2 + unit.upgraded
+                location_hash ^= self.__structure_keys[key]
+
+        blocked = location_hash != 0
+        if blocked != self.blocked_grid[index]:
+            self.blocked_grid[index] = blocked
+            self.__blocked_hash ^= self.__blocked_keys[index]
+        if self.__threat is not None and location_hash != self.__location_hashes[index]:
+            self.__remove_threat(index)
+            self.__add_threat(x, y)
+        self.structure_hash ^= self.__location_hashes[index] ^ location_hash
+        self.__location_hashes[index] = location_hash
+        if self.__unit_index is not None:
+            self.__index_location(x, y)
+        if self.__structure_arrays is not None:
+            self.__store_structure(x, y)
+
+    def _update_health(self, unit):
+        """Brings structure_health up to date when the health of a unit on this map is set
+        """
+        if self.__structure_arrays is not None and unit.stationary and 0 <= unit.x < self.ARENA_SIZE and 0 <= unit.y < self.ARENA_SIZE:
+            if any(location_unit is unit for location_unit in self.__map[unit.x][unit.y]):
+                self.__structure_arrays[2][unit.x, unit.y] = unit.health
+
+    @property
+    def structure_types(self):
+        return self.__get_structure_array(0)
+
+    @property
+    def structure_owners(self):
+        return self.__get_structure_array(1)
+
+    @property
+    def structure_health(self):
+        return self.__get_structure_array(2)
+
+    @property
+    def structure_upgraded(self):
+        return self.__get_structure_array(3)
+
+    def __get_structure_array(self, array_index):
+        if self.__structure_arrays is None:
+            if np is None:
+                self.warn("NumPy is not installed, the structure arrays are not available")
+                return None
+            shape = (self.ARENA_SIZE, self.ARENA_SIZE)
+            self.__structure_arrays = [np.full(shape, -1, dtype=np.int8), np.full(shape, -1, dtype=np.int8), 
+                                       np.zeros(shape, dtype=float), np.zeros(shape, dtype=bool)]
+            for index, location_hash in enumerate(self.__location_hashes):
+                if location_hash:
+                    self.__store_structure(index // self.ARENA_SIZE, index % self.ARENA_SIZE)
+        # Views are made on each use rather than kept, so copying the map cannot separate them from the arrays
+        view = self.__structure_arrays[array_index].view()
+        view.flags.writeable = False
+        return view
+
+    def __store_structure(self, x, y):
+        """Copies the structure at a location, if any, into the structure arrays
+        """
+        types, owners, health, upgraded = self.__structure_arrays
+        for unit in self.__map[x][y]:
+            if unit.stationary:
+                types[x, y] = self.__type_indices[unit.unit_type]
+                owners[x, y] = 1 if unit.player_index == 1 else 0
+                health[x, y] = unit.health
+                upgraded[x, y] = unit.upgraded
+                return
+        types[x, y] = -1
+        owners[x, y] = -1
+        health[x, y] = 0
+        upgraded[x, y] = False
+
+    def __index_entries(self, player_index, unit_type):
+        """Gets the index entries of a player's units of a type, or of every type if unit_type is None
+        """
+        if self.__unit_index is None:
+            self.__unit_index = {}
+            self.__indexed = [None] * (self.ARENA_SIZE * self.ARENA_SIZE)
+            for x in range(self.ARENA_SIZE):
+                for y in range(self.ARENA_SIZE):
+                    if self.__map[x][y]:
+                        self.__index_location(x, y)
+        player = 1 if player_index == 1 else 0
+        if unit_type is not None:
+            entry = self.__unit_index.get((player, unit_type))
+            return [] if entry is None else [entry]
+        return [entry for key, entry in self.__unit_index.items() if key[0] == player]
+
+    def __index_location(self, x, y):
+        """Brings the unit indexes up to date with the units at a location
+        """
+        index = x * self.ARENA_SIZE + y
+        counts = {}
+        for unit in self.__map[x][y]:
+            key = (1 if unit.player_index == 1 else 0, unit.unit_type)
+            counts[key] = counts.get(key, 0) + 1
+        old_counts = self.__indexed[index]
+        if old_counts == counts or (old_counts is None and not counts):
+            return
+        if old_counts is not None:
+            for key, count in old_counts.items():
+                rows, row_counts, column_counts = self.__unit_index[key]
+                del rows[y][x]
+                row_counts[y] -= count
+                column_counts[x] -= count
+        for key, count in counts.items():
+            entry = self.__unit_index.get(key)
+            if entry is None:
+                entry = ([{} for _ in range(self.ARENA_SIZE)], [0] * self.ARENA_SIZE, [0] * self.ARENA_SIZE)
+                self.__unit_index[key] = entry
+            entry[0][y][x] = count
+            entry[1][y] += count
+            entry[2][x] += count
+        self.__indexed[index] = counts if counts else None
+
+    def _get_threat(self, x, y, player_index):
+        """Gets the structures threatening a unit of player_index at [x, y], from the threat grids.
+        The grids are built the first time they are used and kept up to date by _update_location.
+
+        Returns:
+            (count, damage_i, damage_f, sources), where sources is a tuple of the attacking structures'
+            locations as x * ARENA_SIZE + y, in increasing order
+        """
+        if self.__threat is None:
+            self.__build_threat()
+        index = x * self.ARENA_SIZE + y
+        owner = 0 if player_index == 1 else 1
+        counts, damage_i, damage_f, sources, _ = self.__threat
+        return counts[owner][index], damage_i[owner][index], damage_f[owner][index], sources[owner][index]
+
+    def _get_damage_grid(self, player_index):
+        """Gets the damage structures deal each frame to a mobile unit of player_index, per location x * ARENA_SIZE + y.
+        The grid is kept up to date by _update_location and must not be changed.
+        """
+        if self.__threat is None:
+            self.__build_threat()
+        return self.__threat[1][0 if player_index == 1 else 1]
+
+    def __build_threat(self):
+        size = self.ARENA_SIZE * self.ARENA_SIZE
+        self.__threat = [[[0] * size, [0] * size], [[0] * size, [0] * size], [[0] * size, [0] * size], 
+                         [[()] * size, [()] * size], [None] * size]
+        for index in range(size):
+            if self.__location_hashes[index]:
+                self.__add_threat(index // self.ARENA_SIZE, index % self.ARENA_SIZE)
+
+    def __add_threat(self, x, y):
+        """Adds the structure at a location, if it attacks, to the threat grids of its owner
+        """
+        counts, damage_i, damage_f, sources, entries = self.__threat
+        for unit in self.__map[x][y]:
+            if unit.stationary and unit.damage_i + unit.damage_f > 0:
+                index = x * self.ARENA_SIZE + y
+                owner = 1 if unit.player_index == 1 else 0
+                attack_range = unit.attackRange
+                cells = []
+                for i, j in self._locations_in_range(x, y, attack_range):
+                    if self.distance_between_locations((x, y), (i, j)) <= attack_range:
+                        cell = i * self.ARENA_SIZE + j
+                        cells.append(cell)
+                        counts[owner][cell] += 1
+                        damage_i[owner][cell] += unit.damage_i
+                        damage_f[owner][cell] += unit.damage_f
+                        sources[owner][cell] = tuple(sorted(sources[owner][cell] + (index,)))
+                entries[index] = (owner, unit.damage_i, unit.damage_f, cells)
+                return
+
+    def __remove_threat(self, index):
+        """Takes the structure recorded at a location out of the threat grids
+        """
+        counts, damage_i, damage_f, sources, entries = self.__threat
+        entry = entries[index]
+        if entry is None:
+            return
+        owner, unit_damage_i, unit_damage_f, cells = entry
+        for cell in cells:
+            counts[owner][cell] -= 1
+            damage_i[owner][cell] -= unit_damage_i
+            damage_f[owner][cell] -= unit_damage_f
+            sources[owner][cell] = tuple(source for source in sources[owner][cell] if source != index)
+        entries[index] = None
+
     def _invalid_coordinates(self, location):
         self.warn("{} is out of bounds.".format(str(location)))
 
@@ -149,13 +454,14 @@ class GameMap:
             bottom_right.append([int(x), int(y)])
         return [top_right, top_left, bottom_left, bottom_right]
     
-    def add_unit(self, unit_type, location, player_index=0):
+    def add_unit(self, unit_type, location, player_index=0, health=None):
         """Add a single GameUnit to the map at the given location.
 
         Args:
             unit_type: The type of the new unit. Use the constants provided in algo_strategy.
             location: A list of two integers representing the [x,y] coordinate of the new unit
             player_index: The index corresponding to the player controlling the new unit, 0 for you 1 for the enemy
+            health: The starting health of the new unit. Full health if None.
 
         This function does not affect your turn and only changes the data stored in GameMap. The intended use of this function
         is to allow you to create arbitrary gamestates. Using this function on the game_map provided with game_state will 
@@ -167,11 +473,15 @@ class GameMap:
             self.warn("Player index {} is invalid. Player index should be 0 or 1.".format(player_index))
 
         x, y = location
-        new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
+        new_unit = GameUnit(unit_type, self.config, player_index, health, location[0], location[1])
+        new_unit._game_map = self
         if not new_unit.stationary:
             self.__map[x][y].append(new_unit)
+            if self.__unit_index is not None:
+                self.__index_location(x, y)
         else:
             self.__map[x][y] = [new_unit]
+            self._update_location(x, y)
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -187,6 +497,77 @@ class GameMap:
         
         x, y = location
         self.__map[x][y] = []
+        self._update_location(x, y)
+
+    def get_blocked_hash(self):
+        """Gets a hash identifying which locations hold structures
+
+        Returns:
+            A 64 bit Zobrist hash of blocked_grid, updated in constant time as structures are added or removed.
+            Unlike structure_hash it ignores structure type, owner and upgrades, which do not affect pathing.
+
+        """
+        return self.__blocked_hash
+
+    def units_of(self, player_index, unit_type=None, x_range=None, y_range=None):
+        """Gets the units of a player, of one type or all of them, within a set of columns and rows
+
+        Reads indexes of the units by player, type and row, so the time taken depends on the number of units found
+        rather than on the size of the map. The indexes are built the first time they are used.
+
+        Args:
+            player_index: The player whose units to get, 0 for you 1 for the enemy
+            unit_type: The type of the units to get, or None for units of every type
+            x_range: The x coordinates to search, such as range(0, 14) or a list, or None for all of them
+            y_range: The y coordinates to search, or None for all of them
+
+        Returns:
+            A list of GameUnits, ordered by y and then by x as when iterating over the map
+
+        """
+        entries = self.__index_entries(player_index, unit_type)
+        player = 1 if player_index == 1 else 0
+        if y_range is None:
+            rows = range(self.ARENA_SIZE)
+        else:
+            rows = sorted(set(y for y in y_range if 0 <= y < self.ARENA_SIZE))
+        units = []
+        for y in rows:
+            columns = set()
+            for row_locations, row_counts, _ in entries:
+                if row_counts[y]:
+                    columns.update(row_locations[y])
+            for x in sorted(columns):
+                if x_range is None or x in x_range:
+                    for unit in self[x, y]:
+                        if (1 if unit.player_index == 1 else 0) == player and (unit_type is None or unit.unit_type == unit_type):
+                            units.append(unit)
+        return units
+
+    def count_units_of(self, player_index, unit_type=None, x_range=None, y_range=None):
+        """Counts the units of a player, of one type or all of them, within a set of columns and rows.
+        Takes the same arguments as units_of, and reads per row and per column counts when only one range is given.
+
+        Returns:
+            The number of units units_of would return
+
+        """
+        entries = self.__index_entries(player_index, unit_type)
+        if x_range is None or y_range is None:
+            if x_range is None:
+                lines = range(self.ARENA_SIZE) if y_range is None else set(y_range)
+                counts_index = 1
+            else:
+                lines = set(x_range)
+                counts_index = 2
+            return sum(entry[counts_index][line] for entry in entries for line in lines if 0 <= line < self.ARENA_SIZE)
+        count = 0
+        for y in set(y_range):
+            if 0 <= y < self.ARENA_SIZE:
+                for row_locations, row_counts, _ in entries:
+                    if row_counts[y]:
+                        count += sum(units for x, units in row_locations[y].items() if x in x_range)
+        return count
 
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
@@ -204,17 +585,27 @@ class GameMap:
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
 
-        x, y = location
-        locations = []
+        return [[i, j] for i, j in self._locations_in_range(location[0], location[1], radius)]
+
+    def _locations_in_range(self, x, y, radius):
+        """Gets the locations within radius of [x, y] as a tuple of (x, y) tuples, in the order of get_locations_in_range.
+        The tuple is cached per location and radius and shared, so it must not be changed.
+        """
+        if 0 <= x < self.ARENA_SIZE and 0 <= y < self.ARENA_SIZE and x == int(x) and y == int(y):
+            offsets, cells = _get_range_table(radius, self.__hit_radius, self.ARENA_SIZE)
+            index = int(x) * self.ARENA_SIZE + int(y)
+            locations = cells[index]
+            if locations is None:
+                x, y = int(x), int(y)
+                locations = tuple((x + i, y + j) for i, j in offsets if self.in_arena_bounds((x + i, y + j)))
+                cells[index] = locations
+            return locations
+        # Centers off the grid, such as non-integer ones, are measured from their real position over the cells around them
         search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
-        for i in range(int(x - search_radius), int(x + search_radius + 1)):
-            for j in range(int(y - search_radius), int(y + search_radius + 1)):
-                new_location = [i, j]
-                # A unit with a given range affects all locations who's centers are within that range + get hit radius
-                if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + getHitRadius:
-                    locations.append(new_location)
-        return locations
+        reach = radius + self.__hit_radius
+        return tuple((i, j) for i in range(int(x - search_radius), int(x + search_radius + 1)) 
+                     for j in range(int(y - search_radius), int(y + search_radius + 1))
+                     if self.in_arena_bounds((i, j)) and math.sqrt((x - i)**2 + (y - j)**2) < reach)
 
     def distance_between_locations(self, location_1, location_2):
         """Euclidean distance
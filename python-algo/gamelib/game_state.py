@@ -2,8 +2,8 @@ import math
 import json
 import sys
 
-from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
+from .navigation import ShortestPathFinder, PathCache
+from .util import send_command, debug_write, decode
 from .unit import GameUnit
 from .game_map import GameMap
 
@@ -44,20 +44,36 @@ class GameState:
         * my_time (int): The time you took to submit your previous turn
         * enemy_health (int): Your opponents current remaining health
         * enemy_time (int): Your opponents current remaining time
+        * path_cache (:obj: PathCache): The cache used by pathing functions, or None if paths are not cached
+        * serialized_string (string): The game state message this GameState was built from. For one built from a dict, 
+          the dict is encoded as json the first time this is read.
+
+    To try out several candidate turns on one GameState, call checkpoint() before each, and rollback() after 
+    evaluating it. Everything attempt_spawn, attempt_upgrade and attempt_remove changed is undone, 
+    in time proportional to the number of changes.
 
     """
 
-    def __init__(self, config, serialized_string):
+    def __init__(self, config, serialized_string, path_cache=None):
         """ Setup a turns variables using arguments passed
 
         Args:
             * config (JSON): A json object containing information about the game
-            * serialized_string (string): A string containing information about the game state at the start of this turn
+            * serialized_string (string): A string containing information about the game state at the start of this turn. 
+              The dict parsed from it is also accepted, see from_dict.
+            * path_cache (:obj: PathCache): A cache for find_path_to_edge and find_paths_to_edges results. 
+              Pass the same cache to every GameState you create to reuse paths across turns and action frames.
 
         """
-        self.serialized_string = serialized_string
+        if isinstance(serialized_string, str):
+            self.__serialized_string = serialized_string
+            self.__state = None
+        else:
+            self.__serialized_string = None
+            self.__state = serialized_string
         self.config = config
         self.enable_warnings = True
+        self.path_cache = path_cache
 
         global WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
         UNIT_TYPE_TO_INDEX = {}
@@ -90,20 +106,141 @@ class GameState:
         SP = self.SP
 
         self.game_map = GameMap(self.config)
-        self._shortest_path_finder = ShortestPathFinder()
+        self._shortest_path_finder = ShortestPathFinder("flat")
         self._build_stack = []
         self._deploy_stack = []
+        # Keyed by player and blocked hash, keeping the coverage maps of the last few layouts, shared with clones
+        self.__coverage_maps = PathCache(16)
+        self.__undo_log = None
+        self.__checkpoints = []
         self._player_resources = [
                 {'SP': 0, 'MP': 0},  # player 0, which is you
                 {'SP': 0, 'MP': 0}]  # player 1, which is the opponent
-        self.__parse_state(serialized_string)
+        if isinstance(serialized_string, str):
+            self.__parse_state(decode(serialized_string))
+        else:
+            self.__parse_state(serialized_string)
+
+    @classmethod
+    def from_dict(cls, config, state, path_cache=None):
+        """ Setup a turns variables from a game state that has already been parsed from json, 
+        such as the one AlgoCore passes to on_turn when dispatch_parsed is set. Skips parsing the message again.
+
+        Args:
+            * config (JSON): A json object containing information about the game
+            * state (dict): The game state at the start of this turn, as parsed from the engine's message
+            * path_cache (:obj: PathCache): A cache for find_path_to_edge and find_paths_to_edges results
+
+        Returns:
+            A new GameState
+
+        """
+        return cls(config, state, path_cache)
+
+    @property
+    def serialized_string(self):
+        if self.__serialized_string is None:
+            self.__serialized_string = json.dumps(self.__state)
+        return self.__serialized_string
+
+    @serialized_string.setter
+    def serialized_string(self, serialized_string):
+        self.__serialized_string = serialized_string
+
+    def clone(self):
+        """Makes a copy of this game state to try out hypothetical turns on, without affecting it
+
+        Much cheaper than copy.deepcopy: the config, the unit stats and the path cache are shared, and only
+        the resources, the queued structures and units, and the map and its units are copied.
+
+        Returns:
+            A new GameState. Spawning, upgrading or removing on it, or changing its game_map, leaves this one unchanged.
+
+        """
+        clone = GameState.__new__(GameState)
+        clone.__dict__.update(self.__dict__)
+        clone.game_map = self.game_map.clone()
+        clone._shortest_path_finder = ShortestPathFinder(self._shortest_path_finder.engine)
+        clone._build_stack = list(self._build_stack)
+        clone._deploy_stack = list(self._deploy_stack)
+        clone._player_resources = [dict(resources) for resources in self._player_resources]
+        clone.__undo_log = None
+        clone.__checkpoints = []
+        return clone
+
+    def checkpoint(self):
+        """Starts recording changes so they can be undone by rollback()
+
+        From now on, every change attempt_spawn, attempt_upgrade and attempt_remove make to the map, 
+        the resources and the queued structures and units is recorded. Checkpoints can be nested, 
+        each rollback() or commit() ends the most recent one.
+
+        Returns:
+            The number of checkpoints now open
+        """
+        if self.__undo_log is None:
+            self.__undo_log = []
+        self.__checkpoints.append(len(self.__undo_log))
+        return len(self.__checkpoints)
+
+    def rollback(self):
+        """Undoes every change recorded since the most recent checkpoint, and ends it
+
+        Changes made directly to game_map, rather than through the attempt functions, are not undone.
+
+        Returns:
+            The number of changes undone
+        """
+        if not self.__checkpoints:
+            self.warn("rollback was called without a checkpoint")
+            return 0
+        start = self.__checkpoints.pop()
+        undone = len(self.__undo_log) - start
+        while len(self.__undo_log) > start:
+            change = self.__undo_log.pop()
+            if change[0] == "resource":
+                _, player_index, resource_key, amount = change
+                self._player_resources[player_index][resource_key] = amount
+            elif change[0] == "stack":
+                change[1].pop()
+            elif change[0] == "location":
+                _, x, y, units = change
+                # The strategy may still hold the logged units, so changes made through them must not reach the map
+                self.game_map[x, y] = [unit._copy(self.game_map) for unit in units]
+            elif change[0] == "upgrade":
+                _, x, y = change
+                for unit in self.game_map[x, y]:
+                    if unit.stationary:
+                        unit._undo_upgrade()
+        if not self.__checkpoints:
+            self.__undo_log = None
+        return undone
+
+    def commit(self):
+        """Ends the most recent checkpoint and keeps the changes made since. If a checkpoint is still open 
+        around it, a rollback() of that one undoes them too.
+        """
+        if not self.__checkpoints:
+            self.warn("commit was called without a checkpoint")
+            return
+        self.__checkpoints.pop()
+        if not self.__checkpoints:
+            self.__undo_log = None
+
+    def __record(self, change):
+        if self.__undo_log is not None:
+            self.__undo_log.append(change)
 
-    def __parse_state(self, state_line):
+    def __queue(self, stack, entry):
+        stack.append(entry)
+        if self.__undo_log is not None:
+            self.__undo_log.append(("stack", stack))
+
+    def __parse_state(self, state):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state is the game state as parsed from json.
         """
-        state = json.loads(state_line)
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -146,8 +283,7 @@ class GameState:
                     if self.contains_stationary_unit([x,y]):
                         self.game_map[x,y][0].upgrade()
                 else:
-                    unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
-                    self.game_map[x,y].append(unit)
+                    self.game_map.add_unit(unit_type, [x, y], player_number, hp)
 
     def __resource_required(self, unit_type):
         return self.SP if is_stationary(unit_type) else self.MP
@@ -163,6 +299,8 @@ class GameState:
         elif resource_type == self.SP:
             resource_key = 'SP'
         held_resource = self.get_resource(resource_type, player_index)
+        if self.__undo_log is not None:
+            self.__undo_log.append(("resource", player_index, resource_key, self._player_resources[player_index][resource_key]))
         self._player_resources[player_index][resource_key] = held_resource + amount
 
     def _invalid_player_index(self, index):
@@ -381,11 +519,13 @@ class GameState:
                     costs = self.type_cost(unit_type)
                     self.__set_resource(SP, 0 - costs[SP])
                     self.__set_resource(MP, 0 - costs[MP])
+                    if self.__undo_log is not None:
+                        self.__undo_log.append(("location", x, y, list(self.game_map[x, y])))
                     self.game_map.add_unit(unit_type, location, 0)
                     if is_stationary(unit_type):
-                        self._build_stack.append((unit_type, x, y))
+                        self.__queue(self._build_stack, (unit_type, x, y))
                     else:
-                        self._deploy_stack.append((unit_type, x, y))
+                        self.__queue(self._deploy_stack, (unit_type, x, y))
                     spawned_units += 1
                 else:
                     break
@@ -407,7 +547,7 @@ class GameState:
         for location in locations:
             if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
                 x, y = map(int, location)
-                self._build_stack.append((REMOVE, x, y))
+                self.__queue(self._build_stack, (REMOVE, x, y))
                 removed_units += 1
             else:
                 self.warn("Could not remove a unit from {}. Location has no structures or is enemy territory.".format(location))
@@ -442,7 +582,8 @@ class GameState:
                         self.__set_resource(SP, 0 - costs[SP])
                         self.__set_resource(MP, 0 - costs[MP])
                         existing_unit.upgrade()
-                        self._build_stack.append((UPGRADE, x, y))
+                        self.__record(("upgrade", x, y))
+                        self.__queue(self._build_stack, (UPGRADE, x, y))
                         spawned_units += 1
             else:
                 self.warn("Could not upgrade a unit from {}. Location has no structures or is enemy territory.".format(location))
@@ -481,7 +622,8 @@ class GameState:
 
         Returns:
             A list of locations corresponding to the path the unit would take 
-            to get from it's starting location to the best available end location
+            to get from it's starting location to the best available end location.
+            Paths from the path_cache are copied into new lists, so they can be changed freely.
 
         """
         if self.contains_stationary_unit(start_location):
@@ -491,9 +633,121 @@ class GameState:
         if target_edge is None:
             target_edge = self.get_target_edge(start_location)
 
+        if self.path_cache is not None:
+            key = self.__path_cache_key(start_location, target_edge)
+            path = self.path_cache.get(key)
+            if path is None:
+                end_points = self.game_map.get_edge_locations(target_edge)
+                path = self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+                path = tuple(map(tuple, path))
+                self.path_cache.put(key, path)
+            return [list(location) for location in path]
+
         end_points = self.game_map.get_edge_locations(target_edge)
         return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
 
+    def find_path_with_removals(self, start_location, removals, target_edge=None):
+        """Gets the path a unit at a given location would take if structures are destroyed along the way, 
+        for example by the unit itself or by a demolisher ahead of it. The unit plans the rest of its path 
+        again after each removal, as it does in game.
+
+        Args:
+            start_location: The location of a hypothetical unit
+            removals: A list of (step, location) pairs. The structure at location is destroyed once the unit has taken that many steps.
+            target_edge: The edge the unit wants to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc. Induced from start_location if None.
+
+        Returns:
+            A list of locations corresponding to the path the unit would take. The game map is not changed.
+
+        """
+        if self.contains_stationary_unit(start_location):
+            self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+            return
+
+        if target_edge is None:
+            target_edge = self.get_target_edge(start_location)
+        end_points = self.game_map.get_edge_locations(target_edge)
+        return self._shortest_path_finder.navigate_with_removals(start_location, end_points, removals, self)
+
+    def __path_cache_key(self, start_location, target_edge):
+        return (int(start_location[0]), int(start_location[1]), target_edge, self.game_map.get_blocked_hash())
+
+    def find_paths_to_edges(self, start_locations, target_edge=None):
+        """Gets the paths units at several locations would take.
+        Much faster than calling find_path_to_edge for each location, since all
+        locations heading to the same edge share one pathfinding search.
+
+        Args:
+            start_locations: A list of locations of hypothetical units
+            target_edge: The edge the units want to reach. Induced from each start location if None.
+
+        Returns:
+            A dict mapping each start location, as an (x, y) tuple, to the path a unit 
+            there would take, as returned by find_path_to_edge. Blocked locations map to None.
+            Paths are looked up in and added to the path_cache if this GameState has one.
+
+        """
+        paths = {}
+        starts_by_edge = {}
+        for start_location in start_locations:
+            if self.contains_stationary_unit(start_location):
+                self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+                paths[tuple(start_location)] = None
+                continue
+            edge = self.get_target_edge(start_location) if target_edge is None else target_edge
+            if self.path_cache is not None:
+                path = self.path_cache.get(self.__path_cache_key(start_location, edge))
+                if path is not None:
+                    paths[tuple(start_location)] = [list(location) for location in path]
+                    continue
+            starts_by_edge.setdefault(edge, []).append(start_location)
+
+        for edge, starts in starts_by_edge.items():
+            end_points = self.game_map.get_edge_locations(edge)
+            edge_paths = self._shortest_path_finder.navigate_multiple_starts(starts, end_points, self)
+            for start_location, path in zip(starts, edge_paths):
+                if self.path_cache is not None:
+                    self.path_cache.put(self.__path_cache_key(start_location, edge), tuple(map(tuple, path)))
+                paths[tuple(start_location)] = path
+        return paths
+
+    def path_coverage_map(self, player_index=1):
+        """Counts how many spawn location paths pass through each location.
+        Paths are found for every open location on the two edges the player spawns from, 
+        sharing one pathfinding search per target edge.
+
+        Args:
+            player_index: The player whose spawns to path from, 0 for you (the bottom edges) and 1 for your opponent (the top edges)
+
+        Returns:
+            A 28 by 28 list of lists indexed [x][y], holding the number of paths that pass through each location.
+            Results for the last 16 layouts are cached by GameMap.get_blocked_hash(), so asking again before the structures change is cheap.
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            self._invalid_player_index(player_index)
+            return
+
+        key = (player_index, self.game_map.get_blocked_hash())
+        coverage = self.__coverage_maps.get(key)
+        if coverage is None:
+            if player_index == 0:
+                edges = [self.game_map.BOTTOM_LEFT, self.game_map.BOTTOM_RIGHT]
+            else:
+                edges = [self.game_map.TOP_LEFT, self.game_map.TOP_RIGHT]
+            spawn_locations = []
+            for edge in edges:
+                for location in self.game_map.get_edge_locations(edge):
+                    if not self.contains_stationary_unit(location):
+                        spawn_locations.append(location)
+
+            coverage = [[0] * self.ARENA_SIZE for _ in range(self.ARENA_SIZE)]
+            for path in self.find_paths_to_edges(spawn_locations).values():
+                for x, y in path:
+                    coverage[x][y] += 1
+            self.__coverage_maps.put(key, coverage)
+        return [list(column) for column in coverage]
+
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
 
@@ -551,7 +805,7 @@ class GameState:
             return
 
         attacker_location = [attacking_unit.x, attacking_unit.y]
-        possible_locations = self.game_map.get_locations_in_range(attacker_location, attacking_unit.attackRange)
+        possible_locations = self.game_map._locations_in_range(attacking_unit.x, attacking_unit.y, attacking_unit.attackRange)
         target = None
         target_stationary = True
         target_distance = sys.maxsize
@@ -566,7 +820,7 @@ class GameState:
 
                 new_target = False
                 unit_stationary = unit.stationary
-                unit_distance = self.game_map.distance_between_locations(location, [attacking_unit.x, attacking_unit.y])
+                unit_distance = self.game_map.distance_between_locations(location, attacker_location)
                 unit_health = unit.health
                 unit_y = unit.y
                 unit_x_distance = abs(self.HALF_ARENA - 0.5 - unit.x)
@@ -618,7 +872,7 @@ class GameState:
             player_index: The index corresponding to the defending player, 0 for you 1 for the enemy
 
         Returns:
-            A list of units that would attack a unit controlled by the given player at the given location
+            A list of units that would attack a unit controlled by the given player at the given location, ordered by their location
 
         """
 
@@ -626,7 +880,16 @@ class GameState:
             self._invalid_player_index(player_index)
         if not self.game_map.in_arena_bounds(location):
             self.warn("Location {} is not in the arena bounds.".format(location))
+            return self.__scan_attackers(location, player_index)
+
+        attackers = []
+        for source in self.game_map._get_threat(int(location[0]), int(location[1]), player_index)[3]:
+            for unit in self.game_map[source // self.ARENA_SIZE, source % self.ARENA_SIZE]:
+                if unit.stationary:
+                    attackers.append(unit)
+        return attackers
 
+    def __scan_attackers(self, location, player_index):
         attackers = []
         """
         Get locations in the range of TURRET units
@@ -635,9 +898,64 @@ class GameState:
         for unit in self.config["unitInformation"]:
             if unit.get('attackRange', 0) >= max_range:
                 max_range = unit.get('attackRange', 0)
-        possible_locations= self.game_map.get_locations_in_range(location, max_range)
+        possible_locations = self.game_map._locations_in_range(location[0], location[1], max_range)
         for location_unit in possible_locations:
             for unit in self.game_map[location_unit]:
-                if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
+                if unit.stationary and unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
                     attackers.append(unit)
         return attackers
+
+    def get_threat(self, location, player_index):
+        """Gets how dangerous a location is to a unit, without listing the structures attacking it
+
+        The threat of every location is worked out once per GameState, the first time this or get_attackers is called,
+        and then kept up to date as structures are added, upgraded or removed, so each call takes constant time.
+
+        Args:
+            location: The location of a hypothetical defender
+            player_index: The index corresponding to the defending player, 0 for you 1 for the enemy
+
+        Returns:
+            (count, damage_i, damage_f): The number of structures that would attack a unit controlled by the given player
+            at the given location, and the damage they deal together each frame to mobile units and to structures
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+        if not self.game_map.in_arena_bounds(location):
+            self.warn("Location {} is not in the arena bounds.".format(location))
+            return (0, 0, 0)
+        return self.game_map._get_threat(int(location[0]), int(location[1]), player_index)[:3]
+
+    def estimate_path_damage(self, path, player_index=0, unit_type=None):
+        """Estimates the damage a mobile unit would take from structures while following a path
+
+        Adds up, over every location of the path, the damage the structures in range deal to mobile units each frame,
+        times the frames the unit spends on each location. Upgraded structures count with their upgraded damage. 
+        Shields, and structures destroyed along the way, are not taken into account.
+
+        Args:
+            path: A list of locations, such as a path returned by find_path_to_edge, or a list of paths to estimate together
+            player_index: The index corresponding to the player whose unit follows the path, 0 for you 1 for the enemy
+            unit_type: The type of the mobile unit, which sets how many frames it spends on each location.
+              If None, one frame is counted per location.
+
+        Returns:
+            The estimated damage, or a list with the estimate of each path if a list of paths was given
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+        frames_per_location = 1
+        if unit_type is not None:
+            if unit_type not in ALL_UNITS or is_stationary(unit_type):
+                self.warn("Passed {} to estimate_path_damage as unit_type. Expected a mobile unit type.".format(unit_type))
+            else:
+                frames_per_location = 1 / GameUnit(unit_type, self.config).speed
+
+        batch = len(path) > 0 and (len(path[0]) == 0 or isinstance(path[0][0], (list, tuple)))
+        paths = path if batch else [path]
+        damage = self.game_map._get_damage_grid(player_index)
+        size = self.ARENA_SIZE
+        totals = [sum([damage[x * size + y] for x, y in path]) * frames_per_location for path in paths]
+        return totals if batch else totals[0]
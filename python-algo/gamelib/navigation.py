@@ -2,24 +2,255 @@ import heapq
 import math
 import sys
 import queue
+from array import array
+from collections import OrderedDict, deque
 from .util import debug_write
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 class Node:
     """A pathfinding node
 
     Attributes :
         * visited_idealness (bool): Have we visited this node during the idealness search step?
         * visited_validate (bool): Have we visited this node during the validation step?
-        * blocked (bool): Is there a structures at this node's location
         * pathlength: The distance between this node and the target location
 
+    Whether a node is blocked is read from GameMap.blocked_grid, which the GameMap keeps up to date.
+
     """
     def __init__(self):
         self.visited_idealness = False
         self.visited_validate = False
-        self.blocked = False
         self.pathlength = -1
 
+class EdgeTable:
+    """Precomputed idealness data for one set of end points
+
+    Attributes :
+        * end_points (list): The end points this table was built for
+        * direction (list): The direction of the end points, see ShortestPathFinder._get_direction_from_endpoints
+        * idealness (list): The idealness of every location, indexed by x * ARENA_SIZE + y, see ShortestPathFinder._get_idealness
+        * members (bytearray): Nonzero at the end points, indexed by x * ARENA_SIZE + y
+        * numpy_idealness: The idealness list as a NumPy array, filled in the first time the NumPy engine uses this table
+
+    """
+    def __init__(self, end_points, direction, arena_size):
+        self.end_points = end_points
+        self.direction = direction
+        self.members = bytearray(arena_size * arena_size)
+        for x, y in end_points:
+            self.members[x * arena_size + y] = True
+
+        self.idealness = []
+        for x in range(arena_size):
+            for y in range(arena_size):
+                if self.members[x * arena_size + y]:
+                    self.idealness.append(sys.maxsize)
+                    continue
+                idealness = 0
+                if direction[1] == 1:
+                    idealness += 28 * y
+                else: 
+                    idealness += 28 * (27 - y)
+                if direction[0] == 1:
+                    idealness += x
+                else: 
+                    idealness += (27 - x)
+                self.idealness.append(idealness)
+        self.numpy_idealness = None
+
+_edge_tables = {}
+
+def _get_edge_tables(game_map):
+    """Gets the EdgeTable of each of the four edges returned by GameMap.get_edges
+
+    The tables are built once per arena size and shared by every pathfinder.
+    """
+    size = game_map.ARENA_SIZE
+    if size not in _edge_tables:
+        tables = []
+        for end_points in game_map.get_edges():
+            x, y = end_points[0]
+            direction = [1 if x >= game_map.HALF_ARENA else -1, 1 if y >= game_map.HALF_ARENA else -1]
+            tables.append(EdgeTable(end_points, direction, size))
+        _edge_tables[size] = tables
+    return _edge_tables[size]
+
+_flat_neighbor_tables = {}
+
+def _get_flat_neighbors(game_map):
+    """Gets the in bounds neighbors of every location as flat indices, x * ARENA_SIZE + y
+
+    Neighbors are listed in the same order as ShortestPathFinder._get_neighbors. 
+    The table is built once per arena size and shared by every pathfinder.
+    """
+    size = game_map.ARENA_SIZE
+    if size not in _flat_neighbor_tables:
+        neighbors = []
+        for x in range(size):
+            for y in range(size):
+                adjacent = [[x, y + 1], [x, y - 1], [x + 1, y], [x - 1, y]]
+                neighbors.append(tuple(nx * size + ny for nx, ny in adjacent if game_map.in_arena_bounds([nx, ny])))
+        _flat_neighbor_tables[size] = tuple(neighbors)
+    return _flat_neighbor_tables[size]
+
+def _flat_wavefront(seeds, blocked, neighbors, pathlength):
+    """Breadth first search over flat indices, x * ARENA_SIZE + y
+
+    Args:
+        * seeds: The indices with a pathlength of 0
+        * blocked: A blocked grid laid out like GameMap.blocked_grid
+        * neighbors: The neighbor table returned by _get_flat_neighbors
+        * pathlength: The pathlength of each index, -1 everywhere it should be set. It is filled in place.
+
+    Like _validate, blocked seeds get a pathlength of 0 but are not searched through.
+
+    """
+    current = deque(seeds)
+    for index in current:
+        pathlength[index] = 0
+
+    while current:
+        current_index = current.popleft()
+        #Blocked edge tiles are valid endpoints, but nothing can path through them
+        if blocked[current_index]:
+            continue
+        next_pathlength = pathlength[current_index] + 1
+        for neighbor in neighbors[current_index]:
+            if pathlength[neighbor] == -1 and not blocked[neighbor]:
+                pathlength[neighbor] = next_pathlength
+                current.append(neighbor)
+
+def _numpy_wavefront(seeds, passable):
+    """Breadth first search of a stack of boards at once, one wavefront step per iteration
+
+    Args:
+        * seeds: A boolean array of shape (boards, ARENA_SIZE, ARENA_SIZE), the tiles with a pathlength of 0
+        * passable: A boolean array of the same shape, True for unblocked tiles inside the arena
+
+    Returns:
+        An int16 array of the same shape holding the pathlength of each tile, -1 where it was not reached.
+        Like _validate, blocked seeds get a pathlength of 0 but are not searched through.
+
+    """
+    result = np.full(seeds.shape, -1, dtype=np.int16)
+    result[seeds] = 0
+    boards = np.arange(seeds.shape[0])
+    pathlength = result.copy()
+    unvisited = ~seeds
+    frontier = seeds & passable
+    step = 0
+    while True:
+        #Boards differ a lot in how long their search runs, so set finished boards aside once half are done
+        active = frontier.reshape(len(boards), -1).any(axis=1)
+        if 2 * np.count_nonzero(active) <= len(boards):
+            finished = ~active
+            result[boards[finished]] = pathlength[finished]
+            if not active.any():
+                return result
+            boards, pathlength, unvisited, frontier, passable = boards[active], pathlength[active], unvisited[active], frontier[active], passable[active]
+
+        step += 1
+        grown = np.zeros_like(frontier)
+        grown[:, :, 1:] |= frontier[:, :, :-1]
+        grown[:, :, :-1] |= frontier[:, :, 1:]
+        grown[:, 1:, :] |= frontier[:, :-1, :]
+        grown[:, :-1, :] |= frontier[:, 1:, :]
+        np.logical_and(grown, passable, out=frontier)
+        frontier &= unvisited
+        unvisited ^= frontier
+        pathlength[frontier] = step
+
+class DistanceField:
+    """The pathlength of every tile towards a set of end points, on a board of our own
+
+    Fields are made by ShortestPathFinder.get_edge_field and kept up to date by ShortestPathFinder.repair_field,
+    which only revisits the tiles whose pathlength changes when a single tile is blocked or unblocked. 
+    This makes trying out one structure at a time much cheaper than searching the whole board again.
+
+    Attributes :
+        * end_points (list): The end points the pathlengths lead to
+        * blocked (bytearray): The blocked grid of the board, laid out like GameMap.blocked_grid. Only change it through repair_field.
+        * pathlength (array): The pathlength of each tile, indexed by x * ARENA_SIZE + y, -1 for tiles that cannot reach the end points
+        * seeds (bytearray): Nonzero at the end points, indexed by x * ARENA_SIZE + y
+
+    """
+    def __init__(self, end_points, blocked, pathlength, seeds):
+        self.end_points = end_points
+        self.blocked = blocked
+        self.pathlength = pathlength
+        self.seeds = seeds
+
+class PathCache:
+    """A least recently used cache of paths
+
+    Paths are keyed by start location, target edge and GameMap.get_blocked_hash(), so a single cache 
+    can be kept for the whole game and shared by every GameState built during it. 
+    Paths are stored as tuples of (x, y) tuples, which cannot be changed by mistake. 
+    GameState copies them into lists of [x, y] lists before returning them, as when there is no cache.
+
+    Attributes :
+        * maxsize (int): The number of paths kept before the least recently used ones are dropped
+        * hits (int): The number of lookups that found a cached path
+        * misses (int): The number of lookups that did not
+
+    """
+    def __init__(self, maxsize=1024):
+        """Creates an empty cache
+
+        Args:
+            maxsize: The number of paths to keep
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__paths = OrderedDict()
+
+    def __len__(self):
+        return len(self.__paths)
+
+    def get(self, key):
+        """Looks up a path
+
+        Args:
+            key: A (x, y, target_edge, blocked_hash) tuple
+
+        Returns:
+            The cached path, or None if it is not cached
+
+        """
+        path = self.__paths.get(key)
+        if path is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__paths.move_to_end(key)
+        return path
+
+    def put(self, key, path):
+        """Caches a path, dropping the least recently used path if the cache is full
+
+        Args:
+            key: A (x, y, target_edge, blocked_hash) tuple
+            path: The path, as a tuple of (x, y) tuples
+
+        """
+        self.__paths[key] = path
+        self.__paths.move_to_end(key)
+        while len(self.__paths) > self.maxsize:
+            self.__paths.popitem(last=False)
+
+    def clear(self):
+        """Empties the cache and resets its hit and miss counts
+        """
+        self.__paths.clear()
+        self.hits = 0
+        self.misses = 0
+
 """
 This class helps with pathfinding. We guarantee the results will
 be accurate, but top players may want to write their own pathfinding
@@ -31,15 +262,48 @@ class ShortestPathFinder:
     Attributes :
         * HORIZONTAL (int): A constant representing a horizontal movement
         * VERTICAL (int): A constant representing a vertical movement
+        * NODES (str): A constant representing the engine that searches a grid of Node objects
+        * FLAT (str): A constant representing the engine that searches flat arrays indexed by x * ARENA_SIZE + y
+        * NUMPY (str): A constant representing the engine that expands whole wavefronts with NumPy
 
+        * engine (str): The engine used by this pathfinder, NODES, FLAT or NUMPY
         * game_state (:obj: GameState): The current gamestate
         * game_map (:obj: GameMap): The current gamemap
+        * blocked_grid (bytearray): The blocked grid of the GameMap we are pathing on, see GameMap.blocked_grid
+
+    The search state and blocked grid persist between calls. As long as we are asked to path on the
+    same GameMap, its blocked grid is already up to date and only the search state is reset.
+
+    All engines follow the same rules and return identical paths. The flat engine keeps its search
+    state in preallocated arrays, uses a deque and precomputed neighbor tables, and is considerably faster.
+    The NumPy engine computes pathlengths with vectorized wavefronts and walks paths like the flat engine. 
+    It pays off when searching many boards at once with navigate_multiple_boards, and falls back to the 
+    flat engine when NumPy is not installed.
+
+    To compare many boards that each differ from the current one by a structure or two, make a DistanceField 
+    with get_edge_field, change it a tile at a time with repair_field and walk paths on it with navigate_field.
 
     """
-    def __init__(self):
+    def __init__(self, engine="nodes"):
+        """Sets up the pathfinder
+
+        Args:
+            engine: The pathfinding engine to use, "nodes", "flat" or "numpy"
+        """
         self.HORIZONTAL = 1
         self.VERTICAL = 2
+        self.NODES = "nodes"
+        self.FLAT = "flat"
+        self.NUMPY = "numpy"
         self.initialized = False
+        self.blocked_grid = None
+        if engine not in [self.NODES, self.FLAT, self.NUMPY]:
+            debug_write("Unknown pathfinding engine '{}', using '{}' instead".format(engine, self.NODES))
+            engine = self.NODES
+        if engine == self.NUMPY and np is None:
+            debug_write("NumPy is not installed, using the '{}' pathfinding engine instead".format(self.FLAT))
+            engine = self.FLAT
+        self.engine = engine
 
     def initialize_map(self, game_state):
         """Initializes the map
@@ -50,7 +314,26 @@ class ShortestPathFinder:
         #Initialize map 
         self.initialized = True
         self.game_state = game_state
+        self.blocked_grid = game_state.game_map.blocked_grid
+        self._neighbors = _get_flat_neighbors(game_state.game_map)
+        if self.engine in [self.FLAT, self.NUMPY]:
+            size = self.game_state.ARENA_SIZE
+            self._unvisited = array('h', [-1]) * (size * size)
+            self._pathlength = array('h', self._unvisited)
+            if self.engine == self.NUMPY:
+                in_bounds = [game_state.game_map.in_arena_bounds([x, y]) for x in range(size) for y in range(size)]
+                self._in_bounds = np.array(in_bounds, dtype=bool).reshape(size, size)
+            return
         self.game_map = [[Node() for x in range(self.game_state.ARENA_SIZE)] for y in range(self.game_state.ARENA_SIZE)]
+        self._nodes = [node for column in self.game_map for node in column]
+
+    def _reset_nodes(self):
+        """Clears the search state left on each node by the previous search
+        """
+        for node in self._nodes:
+            node.visited_idealness = False
+            node.visited_validate = False
+            node.pathlength = -1
 
     def navigate_multiple_endpoints(self, start_point, end_points, game_state):
         """Finds the path a unit would take to reach a set of endpoints
@@ -68,47 +351,406 @@ class ShortestPathFinder:
         if game_state.contains_stationary_unit(start_point):
             return
 
-        #Initialize map 
-        self.initialize_map(game_state)
-        #Fill in walls
-        for location in self.game_state.game_map:
-            if self.game_state.contains_stationary_unit(location):
-                self.game_map[location[0]][location[1]].blocked = True
+        self._prepare_map(game_state)
         #Do pathfinding
-        ideal_endpoints = self._idealness_search(start_point, end_points)
-        self._validate(ideal_endpoints, end_points)
+        self._search(start_point, end_points)
+        return self._walk(start_point, end_points)
+
+    def navigate_multiple_starts(self, start_points, end_points, game_state):
+        """Finds the paths units at several start points would take to reach the same set of endpoints
+
+        Every start that can reach the edge shares the same distance field, so it is computed once
+        and a path is walked out for each of those starts. Starts sealed off from the edge path to their
+        best self destruct location, which is shared by every start in the same pocket.
+
+        Args:
+            * start_points: A list of starting locations
+            * end_points: The end points of the units, should be a list of edge locations
+            * game_state: The current game state
+
+        Returns:
+            A list with the path for each start point, in the same order as start_points.
+            The entry is None for start points blocked by a structure.
+
+        """
+        paths = [None] * len(start_points)
+        pending = []
+        for index, start_point in enumerate(start_points):
+            if not game_state.contains_stationary_unit(start_point):
+                pending.append(index)
+        if not pending:
+            return paths
+
+        #Validating from an endpoint seeds the whole edge, exactly as when the edge is the ideal tile
+        self._prepare_map(game_state)
+        self._search_edge(end_points)
+        pocketed = []
+        for index in pending:
+            start_point = start_points[index]
+            if self._get_pathlength(start_point) == -1:
+                pocketed.append(index)
+            else:
+                paths[index] = self._walk(start_point, end_points)
+
+        #Starts that cannot reach the edge are grouped by the pocket their self destruct search covers
+        seeded = False
+        for index in pocketed:
+            start_point = start_points[index]
+            if not seeded or self._get_pathlength(start_point) == -1:
+                self._prepare_map(game_state)
+                self._search(start_point, end_points)
+                seeded = True
+            paths[index] = self._walk(start_point, end_points)
+        return paths
+
+    def navigate_multiple_boards(self, start_point, end_points, blocked_grids, game_state):
+        """Finds the path a unit would take on each of several hypothetical boards
+
+        With the NumPy engine every board is searched in the same vectorized pass. 
+        Other engines search the boards one at a time.
+
+        Args:
+            * start_point: The starting location of the unit
+            * end_points: The end points of the unit, should be a list of edge locations
+            * blocked_grids: A list of blocked grids laid out like GameMap.blocked_grid, one per board. 
+              Start from a copy of game_state.game_map.blocked_grid and set the tiles you want to change.
+              With the NumPy engine a boolean array of shape (boards, ARENA_SIZE, ARENA_SIZE) also works.
+            * game_state: The current game state
+
+        Returns:
+            A list with the path on each board, in the same order as blocked_grids. 
+            The entry is None for boards where start_point is blocked.
+
+        """
+        self._prepare_map(game_state)
+        own_grid = self.blocked_grid
+        size = game_state.ARENA_SIZE
+        start_index = start_point[0] * size + start_point[1]
+        if self.engine == self.NUMPY:
+            paths = self._numpy_navigate_boards(start_point, end_points, blocked_grids)
+        else:
+            paths = []
+            for blocked_grid in blocked_grids:
+                if blocked_grid[start_index]:
+                    paths.append(None)
+                    continue
+                self.blocked_grid = blocked_grid
+                if self.engine == self.NODES:
+                    self._reset_nodes()
+                self._search(start_point, end_points)
+                paths.append(self._walk(start_point, end_points))
+        self.blocked_grid = own_grid
+        return paths
+
+    def get_edge_field(self, end_points, game_state):
+        """Computes the pathlengths towards a set of end points on the current board
+
+        Args:
+            * end_points: The end points, should be a list of edge locations
+            * game_state: The current game state
+
+        Returns:
+            A DistanceField with its own copy of the blocked grid, for use with repair_field and navigate_field
+
+        """
+        size = game_state.ARENA_SIZE
+        neighbors = _get_flat_neighbors(game_state.game_map)
+        blocked = bytearray(game_state.game_map.blocked_grid)
+        pathlength = array('h', [-1]) * (size * size)
+        seeds = bytearray(size * size)
+        for x, y in end_points:
+            seeds[x * size + y] = True
+        _flat_wavefront([x * size + y for x, y in end_points], blocked, neighbors, pathlength)
+        return DistanceField(end_points, blocked, pathlength, seeds)
+
+    def repair_field(self, field, location, blocked, game_state):
+        """Blocks or unblocks a single tile of a DistanceField and repairs its pathlengths in place
+
+        Only tiles whose pathlength changes are revisited. Unblocking spreads the shorter pathlengths 
+        outwards from the tile. Blocking first finds the tiles that only reached the end points through it, 
+        then searches them again from the tiles around them. Undoing a change restores the field exactly.
+
+        Args:
+            * field: A DistanceField made by get_edge_field
+            * location: The location to change
+            * blocked: True to block the location, as if a structure was placed there, or False to unblock it
+            * game_state: The current game state
+
+        Returns:
+            The number of tiles whose pathlength was revisited
+
+        """
+        size = game_state.ARENA_SIZE
+        index = location[0] * size + location[1]
+        if bool(field.blocked[index]) == bool(blocked):
+            return 0
+        field.blocked[index] = blocked
+        if blocked:
+            return self._block_field_tile(field, index, _get_flat_neighbors(game_state.game_map))
+        return self._unblock_field_tile(field, index, _get_flat_neighbors(game_state.game_map))
+
+    def _unblock_field_tile(self, field, index, neighbors):
+        """Lowers the pathlengths of the tiles that can now path through index
+        """
+        pathlength = field.pathlength
+        blocked = field.blocked
+        if not field.seeds[index]:
+            best = -1
+            for neighbor in neighbors[index]:
+                if not blocked[neighbor] and pathlength[neighbor] != -1 and (best == -1 or pathlength[neighbor] + 1 < best):
+                    best = pathlength[neighbor] + 1
+            if best == -1:
+                return 0
+            pathlength[index] = best
+
+        #A single source, so tiles leave the queue in order of pathlength
+        changed = 1
+        current = deque([index])
+        while current:
+            current_index = current.popleft()
+            next_pathlength = pathlength[current_index] + 1
+            for neighbor in neighbors[current_index]:
+                if not blocked[neighbor] and (pathlength[neighbor] == -1 or pathlength[neighbor] > next_pathlength):
+                    pathlength[neighbor] = next_pathlength
+                    current.append(neighbor)
+                    changed += 1
+        return changed
+
+    def _block_field_tile(self, field, index, neighbors):
+        """Raises the pathlengths of the tiles that only reached the end points through index
+        """
+        pathlength = field.pathlength
+        blocked = field.blocked
+        old_pathlength = pathlength[index]
+        if old_pathlength == -1:
+            return 0
+        #Blocked end points keep a pathlength of 0, they just stop leading anywhere
+        if not field.seeds[index]:
+            pathlength[index] = -1
+
+        #Find the tiles left without a neighbor one step closer to the end points, in order of pathlength
+        affected = []
+        current = deque((neighbor, old_pathlength + 1) for neighbor in neighbors[index])
+        while current:
+            current_index, expected = current.popleft()
+            if pathlength[current_index] != expected or blocked[current_index]:
+                continue
+            supported = False
+            for neighbor in neighbors[current_index]:
+                if not blocked[neighbor] and pathlength[neighbor] == expected - 1:
+                    supported = True
+                    break
+            if supported:
+                continue
+            pathlength[current_index] = -1
+            affected.append(current_index)
+            for neighbor in neighbors[current_index]:
+                current.append((neighbor, expected + 1))
+
+        #Search the affected tiles again, starting from the unaffected tiles around them
+        frontier = []
+        for affected_index in affected:
+            best = -1
+            for neighbor in neighbors[affected_index]:
+                if not blocked[neighbor] and pathlength[neighbor] != -1 and (best == -1 or pathlength[neighbor] + 1 < best):
+                    best = pathlength[neighbor] + 1
+            if best != -1:
+                heapq.heappush(frontier, (best, affected_index))
+        while frontier:
+            current_pathlength, current_index = heapq.heappop(frontier)
+            if pathlength[current_index] != -1 and pathlength[current_index] <= current_pathlength:
+                continue
+            pathlength[current_index] = current_pathlength
+            for neighbor in neighbors[current_index]:
+                if not blocked[neighbor] and (pathlength[neighbor] == -1 or pathlength[neighbor] > current_pathlength + 1):
+                    heapq.heappush(frontier, (current_pathlength + 1, neighbor))
+        return len(affected) + 1
+
+    def navigate_field(self, start_point, field, game_state):
+        """Finds the path a unit would take on the board of a DistanceField
+
+        Args:
+            * start_point: The starting location of the unit
+            * field: A DistanceField made by get_edge_field
+            * game_state: The current game state
+
+        Returns:
+            The path a unit at start_point would take on the board of the field, the same path navigate_multiple_endpoints 
+            would return on that board. None if start_point is blocked. Starts that cannot reach the end points are searched in full.
+
+        """
+        size = game_state.ARENA_SIZE
+        start_index = start_point[0] * size + start_point[1]
+        if field.blocked[start_index]:
+            return None
+        if field.pathlength[start_index] == -1:
+            return self.navigate_multiple_boards(start_point, field.end_points, [field.blocked], game_state)[0]
+
+        self._prepare_map(game_state)
+        own_grid, own_pathlength = self.blocked_grid, getattr(self, "_pathlength", None)
+        self.blocked_grid, self._pathlength = field.blocked, field.pathlength
+        path = self._flat_get_path(start_point, field.end_points)
+        self.blocked_grid, self._pathlength = own_grid, own_pathlength
+        return path
+
+    def navigate_with_removals(self, start_point, end_points, removals, game_state, field=None):
+        """Finds the path a unit would take if structures are destroyed while it moves
+
+        Each time structures are removed the unit plans the rest of its path again from where it stands, 
+        keeping the direction of its last move for tie breaks. The distance field is repaired rather than 
+        searched again, unless the unit is sealed off from the edge and has to find a self destruct location.
+
+        Args:
+            * start_point: The starting location of the unit
+            * end_points: The end points of the unit, should be a list of edge locations
+            * removals: A list of (step, location) pairs. The structure at location is removed once the unit 
+              has taken that many steps, so step 0 removes it before the unit moves.
+            * game_state: The current game state
+            * field: An optional DistanceField for end_points on the current board, made by get_edge_field. 
+              It is restored before returning, so one field can be reused for many sets of removals.
+
+        Returns:
+            The path the unit would take, or None if start_point is blocked
+
+        """
+        size = game_state.ARENA_SIZE
+        if field is None:
+            field = self.get_edge_field(end_points, game_state)
+        if field.blocked[start_point[0] * size + start_point[1]]:
+            return None
+        removals_by_step = {}
+        for step, location in removals:
+            removals_by_step.setdefault(step, []).append(location)
+
+        self._prepare_map(game_state)
+        own_grid, own_pathlength = self.blocked_grid, getattr(self, "_pathlength", None)
+        self.blocked_grid = field.blocked
+        self._pathlength = field.pathlength
+        removed = []
+        path = [start_point]
+        current = start_point[0] * size + start_point[1]
+        move_direction = 0
+        replan = True
+        while True:
+            for location in removals_by_step.get(len(path) - 1, []):
+                if field.blocked[location[0] * size + location[1]]:
+                    self.repair_field(field, location, False, game_state)
+                    removed.append(location)
+                    replan = True
+            if replan:
+                self._pathlength = field.pathlength
+                if field.pathlength[current] == -1:
+                    self._pathlength = self._pocket_pathlength(current, end_points, field)
+                replan = False
+            if self._pathlength[current] == 0:
+                break
+
+            next_move = self._flat_choose_next_move(current, move_direction, end_points)
+            if current // size == next_move // size:
+                move_direction = self.VERTICAL
+            else:
+                move_direction = self.HORIZONTAL
+            path.append([next_move // size, next_move % size])
+            current = next_move
+
+        for location in removed:
+            self.repair_field(field, location, True, game_state)
+        self.blocked_grid, self._pathlength = own_grid, own_pathlength
+        return path
+
+    def _pocket_pathlength(self, start_index, end_points, field):
+        """The pathlengths towards the best self destruct location reachable from start_index, on the board of a field
+        """
+        size = self.game_state.ARENA_SIZE
+        ideal_index = self._flat_idealness_search([start_index // size, start_index % size], end_points)
+        pathlength = array('h', [-1]) * (size * size)
+        _flat_wavefront([ideal_index], field.blocked, self._neighbors, pathlength)
+        return pathlength
+
+    def _prepare_map(self, game_state):
+        """Readies the search state for a new search on the given game state
+        """
+        #Reuse the map if we are still pathing on the same board, its blocked grid is maintained by the GameMap
+        if not self.initialized or self.game_state is not game_state or self.blocked_grid is not game_state.game_map.blocked_grid:
+            self.initialize_map(game_state)
+        elif self.engine == self.NODES:
+            self._reset_nodes()
+
+    def _search(self, start_point, end_points):
+        """Finds the ideal tile for a unit at start_point, then sets the pathlengths towards it
+        """
+        if self.engine == self.FLAT:
+            ideal_index = self._flat_idealness_search(start_point, end_points)
+            self._flat_validate(ideal_index, end_points)
+        elif self.engine == self.NUMPY:
+            self._numpy_search(start_point, end_points, self._numpy_blocked([self.blocked_grid]))
+        else:
+            ideal_tile = self._idealness_search(start_point, end_points)
+            self._validate(ideal_tile, end_points)
+
+    def _search_edge(self, end_points):
+        """Sets the pathlengths towards the end points, as if every unit could reach them
+        """
+        if self.engine == self.FLAT:
+            self._flat_validate(end_points[0][0] * self.game_state.ARENA_SIZE + end_points[0][1], end_points)
+        elif self.engine == self.NUMPY:
+            blocked = self._numpy_blocked([self.blocked_grid])
+            pathlength = _numpy_wavefront(self._numpy_end_mask(end_points, 1), self._in_bounds & ~blocked)
+            self._pathlength = pathlength[0].ravel().tolist()
+        else:
+            self._validate(end_points[0], end_points)
+
+    def _walk(self, start_point, end_points):
+        """Follows the pathlengths set by the last search from start_point to the end of its path
+        """
+        if self.engine in [self.FLAT, self.NUMPY]:
+            return self._flat_get_path(start_point, end_points)
         return self._get_path(start_point, end_points)
 
+    def _get_pathlength(self, location):
+        """The pathlength the last search set at a location, -1 if it was not reached
+        """
+        if self.engine in [self.FLAT, self.NUMPY]:
+            return self._pathlength[location[0] * self.game_state.ARENA_SIZE + location[1]]
+        return self.game_map[location[0]][location[1]].pathlength
+
     def _idealness_search(self, start, end_points):
         """
         Finds the most ideal tile in our 'pocket' of pathable space. 
         The edge if it is available, or the best self destruct location otherwise
         """
+        size = self.game_state.ARENA_SIZE
+        idealness = self._get_edge_table(end_points).idealness
         current = queue.Queue()
         current.put(start)
-        best_idealness = self._get_idealness(start, end_points)
+        best_idealness = idealness[start[0] * size + start[1]]
         self.game_map[start[0]][start[1]].visited_idealness = True
         most_ideal = start
 
         while not current.empty():
             search_location = current.get()
             for neighbor in self._get_neighbors(search_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+                if not self.game_state.game_map.in_arena_bounds(neighbor) or self._is_blocked(neighbor):
                     continue
 
                 x, y = neighbor
-                current_idealness = self._get_idealness(neighbor, end_points)
+                current_idealness = idealness[x * size + y]
 
                 if current_idealness > best_idealness:
                     best_idealness = current_idealness
                     most_ideal = neighbor
 
-                if not self.game_map[x][y].visited_idealness and not self.game_map[x][y].blocked:
+                if not self.game_map[x][y].visited_idealness:
                     self.game_map[x][y].visited_idealness = True
                     current.put(neighbor)
 
         return most_ideal
 
+    def _is_blocked(self, location):
+        """Is there a structure at an in bounds location
+        """
+        return self.blocked_grid[location[0] * self.game_state.ARENA_SIZE + location[1]]
+
     def _get_neighbors(self, location):
         """Get the locations adjacent to a location
         """
@@ -134,29 +776,26 @@ class ShortestPathFinder:
             direction[1] = -1
         return direction
 
+    def _get_edge_table(self, end_points):
+        """Gets the EdgeTable for a set of end points
+
+        The four edges of the map use tables built once per process. Any other set of end points gets a new table.
+        """
+        direction = self._get_direction_from_endpoints(end_points)
+        for table in _get_edge_tables(self.game_state.game_map):
+            if table.direction == direction and table.end_points == end_points:
+                return table
+        return EdgeTable(end_points, direction, self.game_state.ARENA_SIZE)
+
     def _get_idealness(self, location, end_points):
         """Get the idealness of a tile, the reachable tile the unit most wants to path to.
         Better self destruct locations are more ideal. The endpoints are perfectly ideal. 
+        Searches should look up the EdgeTable once and read its idealness list directly.
 
         Returns:
             A location the unit will attempt to reach
         """
-        if location in end_points:
-            return sys.maxsize
-
-        direction = self._get_direction_from_endpoints(end_points)
-
-        idealness = 0
-        if direction[1] == 1:
-            idealness += 28 * location[1]
-        else: 
-            idealness += 28 * (27 - location[1])
-        if direction[0] == 1:
-            idealness += location[0]
-        else: 
-            idealness += (27 - location[0])
-
-        return idealness
+        return self._get_edge_table(end_points).idealness[location[0] * self.game_state.ARENA_SIZE + location[1]]
 
     def _validate(self, ideal_tile, end_points):
         """Breadth first search of the grid, setting the pathlengths of each node
@@ -180,12 +819,13 @@ class ShortestPathFinder:
         while not current.empty():
             current_location = current.get()
             current_node = self.game_map[current_location[0]][current_location[1]]
+            current_blocked = self._is_blocked(current_location)
             for neighbor in self._get_neighbors(current_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+                if not self.game_state.game_map.in_arena_bounds(neighbor) or self._is_blocked(neighbor):
                     continue
 
                 neighbor_node = self.game_map[neighbor[0]][neighbor[1]]
-                if not neighbor_node.visited_validate and not current_node.blocked:
+                if not neighbor_node.visited_validate and not current_blocked:
                     neighbor_node.pathlength = current_node.pathlength + 1
                     neighbor_node.visited_validate = True
                     current.put(neighbor)
@@ -228,7 +868,7 @@ class ShortestPathFinder:
         best_pathlength = self.game_map[current_point[0]][current_point[1]].pathlength
         for neighbor in neighbors:
             #debug_write("Comparing champ {} and contender {}".format(ideal_neighbor, neighbor))
-            if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+            if not self.game_state.game_map.in_arena_bounds(neighbor) or self._is_blocked(neighbor):
                 continue
 
             new_best = False
@@ -289,6 +929,165 @@ class ShortestPathFinder:
             return False
         return True
 
+    def _flat_idealness_search(self, start, end_points):
+        """
+        Flat engine version of _idealness_search, returns the index of the most ideal tile
+        """
+        size = self.game_state.ARENA_SIZE
+        blocked = self.blocked_grid
+        neighbors = self._neighbors
+        idealness = self._get_edge_table(end_points).idealness
+
+        start_index = start[0] * size + start[1]
+        visited = bytearray(size * size)
+        visited[start_index] = True
+        best_idealness = idealness[start_index]
+        most_ideal = start_index
+
+        current = deque([start_index])
+        while current:
+            search_index = current.popleft()
+            for neighbor in neighbors[search_index]:
+                if blocked[neighbor] or visited[neighbor]:
+                    continue
+                visited[neighbor] = True
+                current.append(neighbor)
+
+                #Each tile only needs to be rated when it is first reached
+                if idealness[neighbor] > best_idealness:
+                    best_idealness = idealness[neighbor]
+                    most_ideal = neighbor
+
+        return most_ideal
+
+    def _flat_validate(self, ideal_index, end_points):
+        """Flat engine version of _validate, breadth first search setting the pathlength of each index
+        """
+        size = self.game_state.ARENA_SIZE
+        blocked = self.blocked_grid
+        neighbors = self._neighbors
+        pathlength = self._pathlength
+        pathlength[:] = self._unvisited
+
+        if self._get_edge_table(end_points).members[ideal_index]:
+            seeds = [x * size + y for x, y in end_points]
+        else:
+            seeds = [ideal_index]
+        _flat_wavefront(seeds, blocked, neighbors, pathlength)
+
+    def _flat_get_path(self, start_point, end_points):
+        """Flat engine version of _get_path
+        """
+        size = self.game_state.ARENA_SIZE
+        pathlength = self._pathlength
+        path = [start_point]
+        current = start_point[0] * size + start_point[1]
+        move_direction = 0
+
+        while not pathlength[current] == 0:
+            next_move = self._flat_choose_next_move(current, move_direction, end_points)
+
+            if current // size == next_move // size:
+                move_direction = self.VERTICAL
+            else:
+                move_direction = self.HORIZONTAL
+            path.append([next_move // size, next_move % size])
+            current = next_move
+
+        return path
+
+    def _flat_choose_next_move(self, current_index, previous_move_direction, end_points):
+        """Flat engine version of _choose_next_move, ties are settled by _better_direction
+        """
+        size = self.game_state.ARENA_SIZE
+        blocked = self.blocked_grid
+        pathlength = self._pathlength
+
+        ideal_neighbor = current_index
+        best_pathlength = pathlength[current_index]
+        for neighbor in self._neighbors[current_index]:
+            if blocked[neighbor]:
+                continue
+
+            current_pathlength = pathlength[neighbor]
+            if current_pathlength > best_pathlength:
+                continue
+            elif current_pathlength == best_pathlength:
+                current_point = [current_index // size, current_index % size]
+                neighbor_point = [neighbor // size, neighbor % size]
+                best_point = [ideal_neighbor // size, ideal_neighbor % size]
+                if not self._better_direction(current_point, neighbor_point, best_point, previous_move_direction, end_points):
+                    continue
+
+            ideal_neighbor = neighbor
+            best_pathlength = current_pathlength
+
+        return ideal_neighbor
+
+    def _numpy_blocked(self, blocked_grids):
+        """Stacks blocked grids into a boolean array of shape (boards, ARENA_SIZE, ARENA_SIZE)
+        """
+        size = self.game_state.ARENA_SIZE
+        if isinstance(blocked_grids, np.ndarray):
+            return blocked_grids.astype(bool, copy=False).reshape(-1, size, size)
+        return np.array([np.frombuffer(bytes(grid), dtype=np.uint8) for grid in blocked_grids], dtype=bool).reshape(-1, size, size)
+
+    def _numpy_end_mask(self, end_points, boards):
+        """A boolean array of shape (boards, ARENA_SIZE, ARENA_SIZE), True at the end points
+        """
+        size = self.game_state.ARENA_SIZE
+        members = np.frombuffer(bytes(self._get_edge_table(end_points).members), dtype=np.uint8).astype(bool)
+        return np.broadcast_to(members.reshape(size, size), (boards, size, size)).copy()
+
+    def _numpy_search(self, start_point, end_points, blocked):
+        """NumPy engine version of _search for a stack of boards where start_point is unblocked
+
+        Returns:
+            The pathlengths of every board, an int16 array of shape (boards, ARENA_SIZE, ARENA_SIZE). 
+            The pathlengths of the first board are also kept for walking its path.
+        """
+        boards, size = blocked.shape[0], self.game_state.ARENA_SIZE
+        passable = self._in_bounds & ~blocked
+        end_mask = self._numpy_end_mask(end_points, boards)
+
+        #The pocket of each board is everything reachable from the start
+        start_mask = np.zeros((boards, size, size), dtype=bool)
+        start_mask[:, start_point[0], start_point[1]] = True
+        pocket = _numpy_wavefront(start_mask, passable) >= 0
+
+        #Every tile other than an end point has a distinct idealness, so the best tile of a pocket does not depend on search order
+        table = self._get_edge_table(end_points)
+        if table.numpy_idealness is None:
+            table.numpy_idealness = np.array(table.idealness, dtype=np.int64).reshape(size, size)
+        most_ideal = np.where(pocket, table.numpy_idealness, -1).reshape(boards, -1).argmax(axis=1)
+
+        reaches_edge = (pocket & end_mask).reshape(boards, -1).any(axis=1)
+        seeds = np.zeros((boards, size * size), dtype=bool)
+        seeds[np.arange(boards), most_ideal] = True
+        seeds = seeds.reshape(boards, size, size)
+        seeds[reaches_edge] = end_mask[reaches_edge]
+
+        pathlength = _numpy_wavefront(seeds, passable)
+        self._pathlength = pathlength[0].ravel().tolist()
+        return pathlength
+
+    def _numpy_navigate_boards(self, start_point, end_points, blocked_grids):
+        """NumPy engine version of navigate_multiple_boards
+        """
+        blocked = self._numpy_blocked(blocked_grids)
+        paths = [None] * blocked.shape[0]
+        open_boards = np.flatnonzero(~blocked[:, start_point[0], start_point[1]])
+        if len(open_boards) == 0:
+            return paths
+
+        pathlengths = self._numpy_search(start_point, end_points, blocked[open_boards])
+        flat_blocked = blocked[open_boards].reshape(len(open_boards), -1)
+        for board, pathlength, board_blocked in zip(open_boards, pathlengths, flat_blocked):
+            self.blocked_grid = board_blocked.tobytes()
+            self._pathlength = pathlength.ravel().tolist()
+            paths[board] = self._flat_get_path(start_point, end_points)
+        return paths
+
     def print_map(self):
         """Prints an ASCII version of the current game map for debug purposes
 
@@ -299,9 +1098,9 @@ class ShortestPathFinder:
 
         for y in range(28):
             for x in range(28):
-                node = self.game_map[x][28 - y - 1]
-                if not node.blocked and not node.pathlength == -1:
-                    self._print_justified(node.pathlength)
+                pathlength = self._get_pathlength([x, 28 - y - 1])
+                if not self._is_blocked([x, 28 - y - 1]) and not pathlength == -1:
+                    self._print_justified(pathlength)
                 else:
                     sys.stderr.write("   ")
             debug_write("")
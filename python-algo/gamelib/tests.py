@@ -1,7 +1,25 @@
 import unittest
+import math
+import copy
+import pickle
 import json
+import sys
+import io
+import time
+import threading
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from . import game_map as game_map_module
+from . import unit as unit_module
 from .game_state import GameState
 from .unit import GameUnit
+from .navigation import ShortestPathFinder, PathCache
+from .action_frame import ActionFrame
+from .util import decode
+from .algocore import AlgoCore
+from .time_budget import TimeBudget
 
 class BasicTests(unittest.TestCase):
 
@@ -192,6 +210,32 @@ class BasicTests(unittest.TestCase):
         state.suppress_warnings(True)
         return state
 
+    def _run_algo(self, algo_class, messages, **flags):
+        """Runs an AlgoCore subclass on engine messages fed through stdin, with the given attributes set, and returns it.
+        Fails if the algo is still running after 30 seconds, and raises any error start() raised.
+        """
+        algo = algo_class()
+        for name, value in flags.items():
+            setattr(algo, name, value)
+        errors = []
+        def run():
+            try:
+                algo.start()
+            except Exception as error:
+                errors.append(error)
+        stdin, stderr = sys.stdin, sys.stderr
+        sys.stdin, sys.stderr = io.StringIO("\n".join(messages) + "\n"), io.StringIO()
+        try:
+            runner = threading.Thread(target=run, daemon=True)
+            runner.start()
+            runner.join(30)
+        finally:
+            sys.stdin, sys.stderr = stdin, stderr
+        self.assertFalse(runner.is_alive(), "The algo should stop at the end of the game")
+        if errors:
+            raise errors[0]
+        return algo
+
     def test_basic(self):
         self.assertEqual(True, True, "It's the end of the world as we know it, and I feel fine")
 
@@ -240,6 +284,409 @@ class BasicTests(unittest.TestCase):
         self.assertEqual(1, len(game.game_map.get_locations_in_range([13,13], 0)), "We should be in 0 range of ourself")
         self.assertEqual(37, len(game.game_map.get_locations_in_range([13,13], 3.5)), "Wrong number of tiles in range")
 
+        locations = game.game_map.get_locations_in_range([0,13], 2.5)
+        self.assertEqual(sorted(locations), locations, "Locations should be ordered by x and then y")
+        self.assertTrue(all(game.game_map.in_arena_bounds(location) for location in locations), "Locations should be in bounds")
+        locations.append([5, 5])
+        self.assertNotIn([5, 5], game.game_map.get_locations_in_range([0,13], 2.5), "Each call should return a new list")
+
+    def test_range_tables(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        hit_radius = game.config["unitInformation"][0]['getHitRadius']
+        def scan(x, y, radius):
+            search_radius = math.ceil(radius)
+            return [[i, j] for i in range(int(x - search_radius), int(x + search_radius + 1)) for j in range(int(y - search_radius), int(y + search_radius + 1))
+                    if game_map.in_arena_bounds([i, j]) and game_map.distance_between_locations([x, y], [i, j]) < radius + hit_radius]
+        for radius in [0, 1, 1.5, 2.3, 2.5, 3.5, 4.5]:
+            for x in range(game_map.ARENA_SIZE):
+                for y in range(game_map.ARENA_SIZE):
+                    if game_map.in_arena_bounds([x, y]):
+                        self.assertEqual(scan(x, y, radius), game_map.get_locations_in_range([x, y], radius), "Range {} of {} should match a full scan".format(radius, [x, y]))
+            for x, y in [[13.5, 13], [13.25, 6.5]]:
+                self.assertEqual(scan(x, y, radius), game_map.get_locations_in_range([x, y], radius), "Non-integer centers should give grid cells")
+
+        for index in range(100):
+            game_map.get_locations_in_range([13, 13], 1 + index / 1000)
+        self.assertLessEqual(len(game_map_module._range_tables), game_map_module._RANGE_TABLE_LIMIT, "Range tables should be bounded")
+        self.assertEqual(9, len(game_map.get_locations_in_range([13, 13], 1.45)), "Radii past the limit should still be answered")
+
+    def test_from_dict(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 5], 0)
+        state = json.loads(game.serialized_string)
+        state["p1Units"][2].append([13, 5, 60, "1"])
+        parsed = GameState.from_dict(game.config, state)
+        self.assertEqual(game.get_resources(0), parsed.get_resources(0), "Resources should match the string constructor")
+        self.assertEqual(game.game_map.structure_hash, parsed.game_map.structure_hash, "Units should be placed from the dict")
+        self.assertIsInstance(parsed.serialized_string, str, "serialized_string should stay a string")
+        self.assertEqual(state, json.loads(parsed.serialized_string), "serialized_string should hold the state it was built from")
+
+    def test_decode(self):
+        game = self.make_turn_0_map()
+        self.assertEqual(json.loads(game.serialized_string), decode(game.serialized_string), "Every decoder should parse like json.loads")
+
+    def test_action_frame(self):
+        game = self.make_turn_0_map()
+        state = json.loads(game.serialized_string)
+        state["turnInfo"] = [1, 3, 7]
+        state["p2Units"][0].append([13, 20, 40, "5"])
+        state["p2Units"][6].append([13, 20, 40, "5"])
+        state["events"]["breach"].append([[3, 10], 1, 3, "9", 2])
+        frame = ActionFrame(game.config, json.dumps(state))
+
+        self.assertEqual((3, 7), (frame.turn_number, frame.frame_number), "Turn info should be read")
+        self.assertEqual(state["events"], frame["events"], "The frame should read like the parsed json")
+        self.assertEqual(1, len(frame.events("breach")), "Events should be found by type")
+        self.assertEqual([], frame.events("melee"), "Missing events should be empty")
+
+        units = frame.units(1)
+        self.assertEqual(1, len(units), "Removals should not be separate units")
+        self.assertTrue(units[0].pending_removal, "Removals should mark the structure")
+        self.assertIs(units, frame.units(1), "Units should only be built once")
+        self.assertTrue(frame.game_map[13, 20][0].pending_removal, "The map should be built on demand")
+
+    def test_frame_events(self):
+        game = self.make_turn_0_map()
+        config = dict(game.config, replaySave=1)
+        state = json.loads(game.serialized_string)
+        messages = [json.dumps(config, separators=(",", ":"))]
+        for turn_type, frame, breach in [(0, -1, False), (1, 0, False), (1, 1, True), (1, 2, False), (1, 3, False), (0, -1, False), (2, -1, False)]:
+            state["turnInfo"] = [turn_type, 0, frame]
+            state["events"]["breach"] = [[[3, 10], 1, 3, "5", 2]] if breach else []
+            messages.append(json.dumps(state, separators=(",", ":")))
+
+        class RecordingAlgo(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.frames = []
+                self.turns = 0
+            def on_turn(self, turn_state):
+                self.turns += 1
+            def on_action_frame(self, frame):
+                self.frames.append(json.loads(frame)["turnInfo"][2])
+
+        algo = self._run_algo(RecordingAlgo, messages, frame_events=["breach", "death"])
+        self.assertEqual(2, algo.turns, "Every turn should be delivered")
+        self.assertEqual([1, 3], algo.frames, "Only frames with subscribed events and the last frame should be delivered")
+
+    def test_threaded_reader(self):
+        game = self.make_turn_0_map()
+        config = dict(game.config, replaySave=1)
+        state = json.loads(game.serialized_string)
+        messages = [json.dumps(config)]
+        for turn_type, frame in [(0, -1)] + [(1, frame) for frame in range(10)] + [(0, -1), (2, -1)]:
+            state["turnInfo"] = [turn_type, 0, frame]
+            messages.append(json.dumps(state))
+
+        class SlowAlgo(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.frames = []
+                self.turns = 0
+                self.elapsed = []
+            def on_turn(self, turn_state):
+                self.elapsed.append(self.time_budget.elapsed_ms())
+                #Give the reader thread time to queue up every frame
+                if self.turns == 0:
+                    time.sleep(0.2)
+                self.turns += 1
+            def on_action_frame(self, frame):
+                self.frames.append(frame["turnInfo"][2])
+
+        algo = self._run_algo(SlowAlgo, messages, threaded_reader=True, dispatch_parsed=True, frame_queue_size=3)
+        self.assertEqual(2, algo.turns, "Turns should never be dropped")
+        self.assertEqual([7, 8, 9], algo.frames, "The newest frames should be kept")
+        self.assertEqual(7, algo.dropped_frames, "Dropped frames should be counted")
+        self.assertGreaterEqual(algo.elapsed[1], 150, "The time budget should start when the turn was read, not when it was taken off the queue")
+
+    def test_threaded_reader_malformed_message(self):
+        game = self.make_turn_0_map()
+        messages = [json.dumps(dict(game.config, replaySave=1)), game.serialized_string, '{"turnInfo":[x garbage']
+        for threaded_reader in [False, True]:
+            with self.assertRaises(ValueError, msg="A malformed message should fail rather than hang"):
+                self._run_algo(AlgoCore, messages, threaded_reader=threaded_reader)
+
+    def test_speculative_planning(self):
+        game = self.make_turn_0_map()
+        config = dict(game.config, replaySave=1)
+        state = json.loads(game.serialized_string)
+        messages = [json.dumps(config)]
+        state["turnInfo"] = [0, 0, -1]
+        messages.append(json.dumps(state))
+        state["p1Units"][0].append([13, 5, 60, "1"])
+        frame_state = json.loads(json.dumps(state))
+        frame_state["p1Units"][0].append([14, 5, 60, "2"])
+        frame_state["p1Units"][3].append([13, 0, 15, "3"])
+        frame_state["p1Units"][6].append([14, 5, 0, "4"])
+        for frame in range(3):
+            frame_state["turnInfo"] = [1, 0, frame]
+            messages.append(json.dumps(frame_state))
+        for turn_type in [0, 2]:
+            state["turnInfo"] = [turn_type, 1, -1]
+            messages.append(json.dumps(state))
+        projected = GameState.from_dict(config, frame_state)
+        expected = (1, 1, 0, 0, projected.project_future_MP(1, 0), projected.get_resource(projected.SP, 0) + config["resources"]["coresPerRound"])
+
+        class PlanningAlgo(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.plans = []
+            def on_idle_plan(self, predicted_state):
+                game_map = predicted_state.game_map
+                return (predicted_state.turn_number, len(game_map[13, 5]), len(game_map[14, 5]), len(game_map[13, 0]), 
+                        predicted_state.get_resource(predicted_state.MP, 0), predicted_state.get_resource(predicted_state.SP, 0))
+            def on_turn(self, turn_state):
+                self.plans.append(self.get_speculative_plan(GameState.from_dict(self.config, turn_state)))
+
+        algo = self._run_algo(PlanningAlgo, messages, dispatch_parsed=True, speculative_planning=True, idle_plan_wait=30)
+        self.assertEqual([None, expected], algo.plans, "The plan should be made on the board expected on the next turn")
+
+    def test_speculative_planning_stops_stale_plans(self):
+        game = self.make_turn_0_map()
+        config = dict(game.config, replaySave=1)
+        state = json.loads(game.serialized_string)
+        messages = [json.dumps(config)]
+        state["turnInfo"] = [0, 0, -1]
+        messages.append(json.dumps(state))
+        for turn, wall in enumerate([[14, 5], [13, 5], [14, 5]]):
+            state["p1Units"][0] = [wall + [60, str(turn)]]
+            state["turnInfo"] = [1, turn, 0]
+            messages.append(json.dumps(state))
+            state["p1Units"][0] = [[13, 5, 60, str(turn)]]
+            state["turnInfo"] = [0, turn + 1, -1]
+            messages.append(json.dumps(state))
+        messages[-1] = messages[-1].replace('"turnInfo": [0,', '"turnInfo": [2,')
+
+        class SlowPlanningAlgo(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.plans = []
+            def on_idle_plan(self, predicted_state):
+                if predicted_state.contains_stationary_unit([14, 5]):
+                    time.sleep(30)
+                return "quick"
+            def on_turn(self, turn_state):
+                self.plans.append(self.get_speculative_plan(GameState.from_dict(self.config, turn_state)))
+
+        start = time.perf_counter()
+        algo = self._run_algo(SlowPlanningAlgo, messages, dispatch_parsed=True, speculative_planning=True, idle_plan_wait=30)
+        self.assertLess(time.perf_counter() - start, 10, "Plans still running at turn start or at the end of the game should be stopped")
+        self.assertEqual([None, None, "quick"], algo.plans, "A stopped plan should not hold up the next one")
+
+    def test_time_budget(self):
+        game = self.make_turn_0_map()
+        budget = TimeBudget(60, 20)
+        self.assertTrue(0 < budget.remaining_ms() <= 40, "The margin should be kept in hand")
+        self.assertFalse(budget.should_stop(), "A fresh budget should not stop")
+        self.assertTrue(budget.should_stop(50), "Reserving more than is left should stop")
+
+        game.attempt_spawn("FF", [13, 0])
+        budget.set_best(game)
+        game.attempt_spawn("FF", [14, 0])
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = io.StringIO(), io.StringIO()
+        try:
+            budget.start_fallback()
+            time.sleep(0.2)
+            submitted = sys.stdout.getvalue()
+            self.assertFalse(budget.submit(game), "The turn should not be submitted twice")
+            self.assertEqual(submitted, sys.stdout.getvalue(), "Nothing more should be sent")
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        self.assertEqual([json.dumps([["FF", 13, 0]]), json.dumps([])], submitted.splitlines(), "The best turn should be submitted when time runs out")
+        self.assertTrue(budget.should_stop(), "Searches should stop once the turn is submitted")
+
+    def test_path_updates_with_map(self):
+        game = self.make_turn_0_map()
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual([13, 0], path[0], "Path should start at the spawn location")
+        self.assertIn(path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "Path should end on the top right edge")
+
+        blocking = [[x, 13] for x in range(28)]
+        for location in blocking:
+            game.game_map.add_unit("FF", location, 0)
+        self.assertTrue(game.game_map.blocked_grid[13 * game.ARENA_SIZE + 13], "Walls should be marked as blocked")
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual(12, path[-1][1], "Path should stop below the wall line")
+
+        game.game_map.remove_unit([20, 13])
+        self.assertFalse(game.game_map.blocked_grid[20 * game.ARENA_SIZE + 13], "Removed walls should not block")
+        path = game.find_path_to_edge([13, 0])
+        self.assertIn([20, 13], path, "Path should go through the gap in the wall line")
+        self.assertIn(path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "Path should reach the edge through the gap")
+
+    def test_find_paths_to_edges(self):
+        game = self.make_turn_0_map()
+        for x in range(5, 28):
+            game.game_map.add_unit("FF", [x, 13], 0)
+        for x in range(0, 4):
+            game.game_map.add_unit("FF", [x, 9], 0)
+        game.game_map.add_unit("FF", [4, 9], 0)
+        game.game_map.add_unit("FF", [4, 10], 0)
+        starts = [[13, 0], [14, 0], [20, 6], [2, 11], [4, 9]]
+        paths = game.find_paths_to_edges(starts)
+        self.assertEqual(len(starts), len(paths), "There should be one path per start location")
+        self.assertIsNone(paths[(4, 9)], "Blocked start locations should have no path")
+        for start in starts[:-1]:
+            self.assertEqual(game.find_path_to_edge(start), paths[tuple(start)], "Batched path from {} differs from find_path_to_edge".format(start))
+
+    def test_pathfinding_engines_match(self):
+        game = self.make_turn_0_map()
+        walls = [[x, 13] for x in range(3, 27)] + [[x, 9] for x in range(0, 20)] + [[6, y] for y in range(10, 13)] + [[20, 20], [13, 27], [14, 26]]
+        for location in walls:
+            game.game_map.add_unit("FF", location, location[1] // 14)
+        locations = [location for location in game.game_map if not game.contains_stationary_unit(location)]
+        for edge in [game.game_map.TOP_RIGHT, game.game_map.TOP_LEFT, game.game_map.BOTTOM_LEFT, game.game_map.BOTTOM_RIGHT]:
+            end_points = game.game_map.get_edge_locations(edge)
+            node_paths = ShortestPathFinder("nodes").navigate_multiple_starts(locations, end_points, game)
+            flat_paths = ShortestPathFinder("flat").navigate_multiple_starts(locations, end_points, game)
+            self.assertEqual(node_paths, flat_paths, "The flat engine should find the same paths as the node engine")
+
+    def test_path_cache(self):
+        game = self.make_turn_0_map()
+        game.path_cache = PathCache(2)
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual((0, 1), (game.path_cache.hits, game.path_cache.misses), "First lookup should miss")
+        self.assertEqual([13, 0], path[0], "Cached paths should be lists of [x, y] lists")
+        path.append([0, 0])
+        path = game.find_path_to_edge([13, 0])
+        self.assertNotIn([0, 0], path, "Changing a returned path should not change the cached one")
+        self.assertEqual(1, game.path_cache.hits, "Second lookup should hit")
+
+        game.game_map.add_unit("FF", path[5], 0)
+        new_path = game.find_path_to_edge([13, 0])
+        self.assertNotIn(path[5], new_path, "Adding a structure should invalidate cached paths")
+        game.game_map.remove_unit(path[5])
+        hits = game.path_cache.hits
+        self.assertEqual(path, game.find_path_to_edge([13, 0]), "Removing the structure again should bring back the cached path")
+        self.assertEqual(hits + 1, game.path_cache.hits)
+
+        paths = game.find_paths_to_edges([[13, 0], [14, 0], [5, 8]])
+        self.assertEqual(path, paths[(13, 0)], "Batched lookups should use the cache")
+        self.assertEqual(hits + 2, game.path_cache.hits, "Batched lookups should use the cache")
+        self.assertEqual(2, len(game.path_cache), "The cache should not grow past its maxsize")
+
+    def test_path_coverage_map(self):
+        game = self.make_turn_0_map()
+        coverage = game.path_coverage_map(1)
+        self.assertEqual(1, coverage[0][14], "Only the path from the corner should pass through it")
+        spawns = game.game_map.get_edge_locations(game.game_map.TOP_LEFT) + game.game_map.get_edge_locations(game.game_map.TOP_RIGHT)
+        total = sum(len(game.find_path_to_edge(location)) for location in spawns)
+        self.assertEqual(total, sum(map(sum, coverage)), "Every location of every spawn path should be counted")
+
+        game.game_map.add_unit("FF", [0, 14], 1)
+        coverage = game.path_coverage_map(1)
+        self.assertEqual(0, coverage[0][14], "Blocked spawn locations should be skipped")
+
+        for x in range(4, 24):
+            game.game_map.add_unit("FF", [x, 14], 1)
+            game.path_coverage_map(1)
+        self.assertEqual(16, len(game._GameState__coverage_maps), "Only the latest layouts should be cached")
+
+    def test_structure_hash(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        empty_hash = game_map.structure_hash
+        game_map.add_unit("FF", [13, 5], 0)
+        wall_hash = game_map.structure_hash
+        self.assertNotEqual(empty_hash, wall_hash, "Adding a structure should change the hash")
+        game_map.add_unit("PI", [13, 5], 0)
+        self.assertEqual(wall_hash, game_map.structure_hash, "Mobile units should not change the hash")
+        game_map[13, 5][0].upgrade()
+        self.assertNotEqual(wall_hash, game_map.structure_hash, "Upgrading a structure should change the hash")
+        game_map.remove_unit([13, 5])
+        self.assertEqual(empty_hash, game_map.structure_hash, "Removing the structure should restore the hash")
+
+        game_map.add_unit("FF", [13, 5], 1)
+        self.assertNotEqual(wall_hash, game_map.structure_hash, "The owner of a structure should change the hash")
+        game_map[13, 5] = []
+        self.assertEqual(empty_hash, game_map.structure_hash, "Assignment should update the hash")
+
+    def test_idealness_tables(self):
+        game = self.make_turn_0_map()
+        pathfinder = ShortestPathFinder("flat")
+        pathfinder.initialize_map(game)
+        top_right = game.game_map.get_edge_locations(game.game_map.TOP_RIGHT)
+        self.assertEqual(sys.maxsize, pathfinder._get_idealness([14, 27], top_right), "Edge tiles should be perfectly ideal")
+        self.assertEqual(28 * 13 + 27, pathfinder._get_idealness([27, 13], top_right), "Tiles further up and right should be more ideal")
+        self.assertEqual(27 * 28 + 27, pathfinder._get_idealness([0, 0], game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT)), "Tiles further down and left should be more ideal")
+
+        some_end_points = top_right[:3]
+        path = pathfinder.navigate_multiple_endpoints([13, 0], some_end_points, game)
+        self.assertIn(path[-1], some_end_points, "Path should end on one of the given end points")
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_engine_matches(self):
+        game = self.make_turn_0_map()
+        walls = [[x, 13] for x in range(3, 27)] + [[x, 9] for x in range(0, 20)] + [[6, y] for y in range(10, 13)]
+        for location in walls:
+            game.game_map.add_unit("FF", location, location[1] // 14)
+        locations = [location for location in game.game_map if not game.contains_stationary_unit(location)]
+        end_points = game.game_map.get_edge_locations(game.game_map.TOP_RIGHT)
+        flat_paths = ShortestPathFinder("flat").navigate_multiple_starts(locations, end_points, game)
+        numpy_paths = ShortestPathFinder("numpy").navigate_multiple_starts(locations, end_points, game)
+        self.assertEqual(flat_paths, numpy_paths, "The NumPy engine should find the same paths as the flat engine")
+
+    def test_navigate_multiple_boards(self):
+        game = self.make_turn_0_map()
+        end_points = game.game_map.get_edge_locations(game.game_map.TOP_RIGHT)
+        open_board = bytearray(game.game_map.blocked_grid)
+        walled_board = bytearray(open_board)
+        for x in range(0, 28):
+            if x != 20:
+                walled_board[x * game.ARENA_SIZE + 13] = True
+        blocked_start = bytearray(open_board)
+        blocked_start[13 * game.ARENA_SIZE + 0] = True
+        boards = [open_board, walled_board, blocked_start]
+
+        for engine in ["nodes", "flat", "numpy"]:
+            paths = ShortestPathFinder(engine).navigate_multiple_boards([13, 0], end_points, boards, game)
+            self.assertEqual(game.find_path_to_edge([13, 0]), paths[0], "Path on an unchanged board should match find_path_to_edge")
+            self.assertIn([20, 13], paths[1], "Path should go through the gap in the wall")
+            self.assertIsNone(paths[2], "There should be no path from a blocked start")
+
+    def test_repair_field(self):
+        game = self.make_turn_0_map()
+        finder = ShortestPathFinder("flat")
+        end_points = game.game_map.get_edge_locations(game.game_map.TOP_RIGHT)
+        field = finder.get_edge_field(end_points, game)
+        original = list(field.pathlength)
+
+        for x in range(0, 28):
+            if x != 20:
+                finder.repair_field(field, [x, 13], True, game)
+        for x in range(0, 28):
+            if x != 20:
+                game.game_map.add_unit("FF", [x, 13], 0)
+        self.assertEqual(list(finder.get_edge_field(end_points, game).pathlength), list(field.pathlength), "Repaired field should match a fresh search")
+        self.assertEqual(game.find_path_to_edge([13, 0]), finder.navigate_field([13, 0], field, game), "Path on the field should match find_path_to_edge")
+
+        for x in range(0, 28):
+            if x != 20:
+                finder.repair_field(field, [x, 13], False, game)
+        self.assertEqual(original, list(field.pathlength), "Undoing the changes should restore the field")
+
+    def test_find_path_with_removals(self):
+        game = self.make_turn_0_map()
+        for x in range(0, 28):
+            if x != 5:
+                game.game_map.add_unit("FF", [x, 13], 1)
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual(path, game.find_path_with_removals([13, 0], []), "Without removals the path should not change")
+
+        opened = game.find_path_with_removals([13, 0], [(3, [14, 13])])
+        self.assertEqual(path[:4], opened[:4], "The unit should follow its path until the structure is destroyed")
+        self.assertIn([14, 13], opened, "The unit should go through the opening")
+        self.assertTrue(game.contains_stationary_unit([14, 13]), "The game map should not change")
+
+        finder = ShortestPathFinder("flat")
+        end_points = game.game_map.get_edge_locations(game.game_map.TOP_RIGHT)
+        field = finder.get_edge_field(end_points, game)
+        original = list(field.pathlength)
+        finder.navigate_with_removals([13, 0], end_points, [(0, [14, 13])], game, field)
+        self.assertEqual(original, list(field.pathlength), "Reused fields should be restored")
+
     def _test_get_attackers(self):
         game = self.make_turn_0_map()
         
@@ -256,6 +703,165 @@ class BasicTests(unittest.TestCase):
         game.game_map.add_unit("DF", [14,14], 1)
         self.assertEqual(3, len(game.get_attackers([13,13], 0)), "We should be in danger from 3 places")
 
+    def test_get_threat(self):
+        game = self.make_turn_0_map()
+        self.assertEqual((0, 0, 0), game.get_threat([13, 13], 0), "Nothing should threaten an empty board")
+        game.game_map.add_unit("DF", [13, 15], 1)
+        game.game_map.add_unit("DF", [12, 14], 1)
+        game.game_map.add_unit("EF", [14, 14], 1)
+        game.game_map.add_unit("PI", [13, 14], 1)
+        self.assertEqual((2, 10, 0), game.get_threat([13, 13], 0), "Only enemy turrets should threaten us")
+        self.assertEqual([[12, 14], [13, 15]], [[unit.x, unit.y] for unit in game.get_attackers([13, 13], 0)], "Attackers should be ordered by location")
+        self.assertEqual((0, 0, 0), game.get_threat([13, 13], 1), "Structures should not threaten their owner")
+
+        game.game_map[13, 15][0].upgrade()
+        self.assertEqual((2, 20, 0), game.get_threat([13, 13], 0), "Upgrades should update the threat")
+        self.assertEqual(1, game.get_threat([14, 12], 0)[0], "Upgrades should extend the threat's range")
+        clone = game.clone()
+        clone.game_map.remove_unit([12, 14])
+        self.assertEqual((1, 15, 0), clone.get_threat([13, 13], 0), "Removing structures should update the threat")
+        self.assertEqual((2, 20, 0), game.get_threat([13, 13], 0), "Clones should have their own threat")
+
+    def test_estimate_path_damage(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 15], 1)
+        path = [[13, 11], [13, 12], [13, 13]]
+        self.assertEqual(5, game.estimate_path_damage(path, 0), "Only one location is in range of the turret")
+        self.assertEqual(10, game.estimate_path_damage(path, 0, "EI"), "Slower units should spend more frames in range")
+        game.game_map[13, 15][0].upgrade()
+        self.assertEqual([30, 0], game.estimate_path_damage([path, [[2, 11]]], 0), "Paths should be estimated together with upgraded damage")
+        self.assertEqual(0, game.estimate_path_damage(path, 1), "Structures should not damage their owner's units")
+
+    def test_units_of(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        game_map.add_unit("DF", [20, 15], 1)
+        game_map.add_unit("FF", [10, 15], 1)
+        game_map.add_unit("DF", [13, 14], 1)
+        game_map.add_unit("DF", [13, 5], 0)
+        self.assertEqual([[13, 14], [20, 15]], [[unit.x, unit.y] for unit in game_map.units_of(1, "DF")], "Units should be ordered by y and then x")
+        self.assertEqual(2, game_map.count_units_of(1, None, None, [15]), "Units of every type should be counted")
+        self.assertEqual(1, game_map.count_units_of(1, None, range(0, 14), [15]), "Units outside x_range should not be counted")
+
+        game_map.remove_unit([20, 15])
+        game_map.add_unit("PI", [13, 0], 0)
+        game_map.add_unit("PI", [13, 0], 0)
+        self.assertEqual(1, len(game_map.units_of(1, "DF")), "Removed units should leave the index")
+        self.assertEqual(2, game_map.count_units_of(0, "PI"), "Stacked mobile units should all be counted")
+        self.assertEqual([], game_map.units_of(0, "FF"), "Types without units should give an empty list")
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_structure_arrays(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        game_map.add_unit("DF", [13, 15], 1)
+        self.assertEqual(2, game_map.structure_types[13, 15], "Arrays should hold structures added before their first use")
+        self.assertEqual(-1, game_map.structure_types[13, 5], "Empty locations should hold -1")
+        game_map.add_unit("FF", [13, 5], 0, 20)
+        game_map.add_unit("PI", [13, 0], 0)
+        self.assertEqual(2, numpy.count_nonzero(game_map.structure_types >= 0), "Mobile units should not be stored")
+        self.assertEqual([0, 1], game_map.structure_owners[13, [5, 15]].tolist())
+        self.assertEqual(20, game_map.structure_health[13, 5])
+
+        game_map[13, 5][0].health = 10
+        game_map[13, 15][0].upgrade()
+        self.assertEqual(10, game_map.structure_health[13, 5], "Setting health should update the arrays")
+        self.assertTrue(game_map.structure_upgraded[13, 15], "Upgrades should update the arrays")
+        game_map.remove_unit([13, 15])
+        self.assertEqual(-1, game_map.structure_owners[13, 15], "Removing a structure should update the arrays")
+        with self.assertRaises(ValueError):
+            game_map.structure_health[13, 5] = 0
+
+        for copied_map in [copy.deepcopy(game_map), pickle.loads(pickle.dumps(game_map))]:
+            copied_map.add_unit("DF", [12, 5], 0)
+            self.assertEqual(2, copied_map.structure_types[12, 5], "Copies of the map should keep their arrays up to date")
+            self.assertEqual(-1, game_map.structure_types[12, 5], "Copies of the map should not share its arrays")
+
+    def test_unit_stats(self):
+        game = self.make_turn_0_map()
+        turret = GameUnit("DF", game.config)
+        other = GameUnit("DF", game.config, 1, 10, 3, 4)
+        self.assertIs(turret._stats, other._stats, "Units of the same type should share their stats")
+        self.assertEqual(10, other.health, "Health should be kept per unit")
+        with self.assertRaises(AttributeError):
+            turret.speed = 1
+
+        upgrade = game.config["unitInformation"][2]["upgrade"]
+        other.upgrade()
+        self.assertEqual(upgrade.get("attackRange", turret.attackRange), other.attackRange, "Upgrades should apply upgraded stats")
+        self.assertEqual(turret.cost[game.SP] + upgrade.get("cost1", 0), other.cost[game.SP], "Upgrades should add their cost")
+        self.assertIsNot(turret._stats, other._stats, "Upgraded units should use the upgraded stats")
+
+        configs = [json.loads(json.dumps(game.config)) for _ in range(20)]
+        for config in configs:
+            GameUnit("DF", config)
+            GameUnit("DF", game.config)
+        self.assertLessEqual(len(unit_module._stats_tables), unit_module._STATS_TABLE_LIMIT, "Stats should only be kept for recent configs")
+        self.assertIs(turret._stats, GameUnit("DF", game.config)._stats, "The config in use should keep its stats")
+        self.assertEqual(turret.attackRange, GameUnit("DF", configs[0]).attackRange, "Configs no longer kept should still get their stats")
+
+    def test_clone(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 5], 0)
+        game.get_resource(game.SP)
+        clone = game.clone()
+        self.assertIs(game.config, clone.config, "Clones should share the config")
+        self.assertEqual(game.game_map.structure_hash, clone.game_map.structure_hash, "Clones should start with the same structures")
+
+        clone.attempt_spawn("FF", [[12, 5], [14, 5]])
+        clone.attempt_upgrade([13, 5])
+        self.assertEqual(0, len(game.game_map[12, 5]), "Spawning on a clone should not change the original map")
+        self.assertFalse(game.game_map[13, 5][0].upgraded, "Upgrading on a clone should not change the original unit")
+        self.assertTrue(clone.game_map[13, 5][0].upgraded, "Upgrading on a clone should change the clone's unit")
+        self.assertEqual([], game._build_stack, "Spawning on a clone should not queue on the original")
+        self.assertNotEqual(game.get_resource(game.SP), clone.get_resource(game.SP), "Resources should be copied")
+
+        game.game_map[13, 5][0].health = 1
+        self.assertNotEqual(1, clone.game_map[13, 5][0].health, "Changes to the original should not reach the clone")
+        self.assertNotEqual(game.game_map.get_blocked_hash(), clone.game_map.get_blocked_hash(), "Pathing should see the clone's structures")
+        self.assertEqual(0, game.game_map.blocked_grid[12 * 28 + 5], "The original blocked_grid should not change")
+
+        turret = game.game_map[13, 5][0]
+        threat = game.get_threat([13, 8], 1)
+        structure_hash = game.game_map.structure_hash
+        clone = game.clone()
+        turret.upgrade()
+        turret.health = 2
+        self.assertNotEqual(threat, game.get_threat([13, 8], 1), "Upgrading should change the original's threat")
+        self.assertFalse(clone.game_map[13, 5][0].upgraded, "Units held from before cloning should not be shared with the clone")
+        self.assertEqual(1, clone.game_map[13, 5][0].health, "Units held from before cloning should not be shared with the clone")
+        self.assertEqual(threat, clone.get_threat([13, 8], 1), "The clone's threat should match its units")
+        self.assertEqual(structure_hash, clone.game_map.structure_hash, "The clone's hash should match its units")
+
+    def test_checkpoint_rollback(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("DF", [13, 5])
+        structure_hash = game.game_map.structure_hash
+        resources = game.get_resources()
+
+        self.assertEqual(1, game.checkpoint())
+        game.attempt_spawn("FF", [[12, 5], [14, 5]])
+        game.attempt_upgrade([13, 5])
+        game.attempt_remove([12, 5])
+        self.assertEqual(2, game.checkpoint())
+        game.attempt_spawn("PI", [13, 0], 2)
+        self.assertEqual(8, game.rollback(), "The nested checkpoint should undo both deploys and their costs")
+        self.assertEqual([], game._deploy_stack)
+        self.assertEqual(0, len(game.game_map[13, 0]))
+
+        game.rollback()
+        self.assertEqual(structure_hash, game.game_map.structure_hash, "Rolling back should restore the structures")
+        self.assertEqual(resources, game.get_resources(), "Rolling back should restore the resources")
+        self.assertEqual([("DF", 13, 5)], game._build_stack, "Rolling back should restore the build stack")
+        self.assertFalse(game.game_map[13, 5][0].upgraded, "Rolling back should undo upgrades")
+        self.assertEqual(0, len(game.game_map[12, 5]))
+
+        game.checkpoint()
+        game.attempt_spawn("FF", [12, 5])
+        game.commit()
+        self.assertEqual(0, game.rollback(), "Committed changes should be kept")
+        self.assertEqual(1, len(game.game_map[12, 5]))
+
     def test_print_unit(self):
         game = self.make_turn_0_map()
 
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+'''
+------------------------------------------------------------------------------------------------
+Short Description:
+Measures how long the python-algo gamelib takes to parse each frame of a replay, comparing
+the standard json module with the decoder gamelib.util.decode picked (orjson, ujson or simdjson
+when one is installed).
+------------------------------------------------------------------------------------------------
+
+README:
+
+This program assumes this file is in the contributions/scripts directory
+
+By default it reads the most recently modified replay in the replays directory:
+>py scripts/contributions/json_benchmark.py
+
+You can specify a replay file with -f:
+>py scripts/contributions/json_benchmark.py -f [REPLAY_FILE].replay
+
+If you have no replay at hand, -s generates that many action frames with a busy board instead:
+>py scripts/contributions/json_benchmark.py -s 500
+
+For each decoder it prints the average time to parse a frame, and the average time to parse
+a frame and build a GameState from it.
+------------------------------------------------------------------------------------------------
+'''
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+file_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(file_dir))
+sys.path.insert(0, os.path.join(parent_dir, "python-algo"))
+
+import gamelib
+from gamelib import util
+
+
+def load_replay(path):
+    """Returns the config and the frames of a replay, as the strings the engine sends"""
+    with open(path) as replay:
+        lines = [line.strip() for line in replay if line.strip()]
+    config = json.loads(lines[0])
+    return config, [line for line in lines[1:] if "turnInfo" in line]
+
+
+def synthetic_frames(count):
+    """Returns the config and count action frames with about 150 units per player"""
+    with open(os.path.join(parent_dir, "game-configs.json")) as config_file:
+        config = json.load(config_file)
+    rng = random.Random(0)
+    frames = []
+    for frame_number in range(count):
+        units = []
+        for player in range(2):
+            unit_lists = [[] for _ in range(8)]
+            for unit_id in range(150):
+                unit_type = rng.choice([0, 0, 0, 1, 2, 2, 3, 4, 5])
+                y = rng.randint(0, 13) if player == 0 else rng.randint(14, 27)
+                half_width = y + 1 if y < 14 else 28 - y
+                x = rng.randint(14 - half_width, 13 + half_width)
+                unit_lists[unit_type].append([x, y, float(rng.randint(1, 75)), str(unit_id)])
+            units.append(unit_lists)
+        events = {
+            "selfDestruct": [], "breach": [], "shield": [], "spawn": [], "melee": [],
+            "damage": [[[rng.randint(0, 27), rng.randint(0, 27)], 6.0, 3, str(i), 1] for i in range(30)],
+            "move": [[[rng.randint(0, 27), rng.randint(0, 27)], [0, 0], [0, 0], 3, str(i), 1] for i in range(40)],
+            "death": [], "attack": [[[0, 0], [1, 1], 6.0, 2, str(i), str(i + 1), 1] for i in range(30)],
+        }
+        frames.append(json.dumps({"p1Units": units[0], "p2Units": units[1], "turnInfo": [1, 5, frame_number],
+                                  "p1Stats": [30.0, 12.0, 4.0, 400], "p2Stats": [28.0, 10.0, 2.0, 380], "events": events}))
+    return config, frames
+
+
+def time_per_frame(function, frames, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for frame in frames:
+            function(frame)
+        elapsed = (time.perf_counter() - start) / len(frames)
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks parsing replay frames")
+    parser.add_argument("-f", "--file", help="the replay to read, defaults to the newest one in the replays directory")
+    parser.add_argument("-s", "--synthetic", type=int, help="generate this many frames instead of reading a replay")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        config, frames = synthetic_frames(args.synthetic)
+        source = "{} synthetic frames".format(len(frames))
+    else:
+        path = args.file
+        if path is None:
+            replays = glob.glob(os.path.join(parent_dir, "replays", "*.replay"))
+            if not replays:
+                print("No replay found in the replays directory, use -f or -s")
+                return
+            path = max(replays, key=os.path.getmtime)
+        config, frames = load_replay(path)
+        source = "{} frames of {}".format(len(frames), path)
+
+    print("Parsing {}".format(source))
+    gamelib.GameState(config, frames[0])
+    for name, decoder in [("json", json.loads), (util.JSON_DECODER, util.decode)]:
+        parse = time_per_frame(decoder, frames)
+        build = time_per_frame(lambda frame: gamelib.GameState.from_dict(config, decoder(frame)), frames)
+        print("{:>10}: {:.3f} ms per frame to parse, {:.3f} ms to parse and build a GameState".format(name, parse, build))
+
+
+if __name__ == "__main__":
+    main()